@@ -10,17 +10,39 @@ import socketserver
 from pathlib import Path
 import time
 import traceback
+import hashlib
 import re
-from urllib.parse import urlparse, parse_qs
+from urllib.parse import urlparse, parse_qs, unquote
 import mimetypes
 import io
+import asyncio
+from http import HTTPStatus
+import shutil
+import tempfile
+import multiprocessing
+import math
+import uuid
+import bisect
+import heapq
+import struct
+import mmap
+import sqlite3
+import select
+import errno
+import ctypes
+import ctypes.util
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # --- Kontrollera och instruera om beroenden ---
 try:
     import pychromecast
     from pychromecast.controllers.media import MediaStatus, MediaStatusListener
     from pychromecast.error import ChromecastConnectionError
-    from pychromecast.discovery import stop_discovery
+    from pychromecast.discovery import CastBrowser, SimpleCastListener
+    import zeroconf
     from PIL import Image
     import requests
 except ImportError:
@@ -34,25 +56,77 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
 
+# yt-dlp som bibliotek är valfritt; saknas det används kommandoradsverktyget.
+try:
+    import yt_dlp
+except ImportError:
+    yt_dlp = None
+
 from PyQt5.QtWidgets import (
-    QApplication, QMainWindow, QPushButton, QFileDialog, QListWidget, QLabel,
+    QApplication, QMainWindow, QPushButton, QFileDialog, QListWidget, QListView, QLabel,
     QVBoxLayout, QHBoxLayout, QWidget, QSlider, QMessageBox, QComboBox,
-    QInputDialog, QListWidgetItem, QDialog, QDialogButtonBox, QCheckBox, QSpinBox, QLineEdit
+    QInputDialog, QDialog, QDialogButtonBox, QCheckBox, QSpinBox, QLineEdit, QMenu
+)
+from PyQt5.QtCore import (
+    Qt, QTimer, QObject, QRunnable, pyqtSignal, pyqtSlot, QThreadPool, QSize,
+    QAbstractListModel, QModelIndex, QMimeData
 )
-from PyQt5.QtCore import Qt, QTimer, QObject, QRunnable, pyqtSignal, pyqtSlot, QThreadPool, QSize
 from PyQt5.QtGui import QFont, QIcon
 
 # --- Konfigurationsfiler och mappar ---
 CONFIG_DIR = Path.home() / ".pycast_live"
 THUMBNAIL_DIR = CONFIG_DIR / "thumbnails"
 SUBTITLE_DIR = CONFIG_DIR / "subtitles"
+HLS_DIR = CONFIG_DIR / "hls"
+TRANSCODE_CACHE_DIR = CONFIG_DIR / "transcode_cache"
+IMAGE_CACHE_DIR = CONFIG_DIR / "image_cache"
+REMOTE_CACHE_DIR = CONFIG_DIR / "remote_cache"
 SETTINGS_FILE = CONFIG_DIR / "settings.json"
 RESUME_FILE = CONFIG_DIR / "resume_points.json"
+METADATA_CACHE_FILE = CONFIG_DIR / "metadata_cache.json"
+LIBRARY_DB_FILE = CONFIG_DIR / "library.db"
+URL_INFO_CACHE_FILE = CONFIG_DIR / "url_info_cache.json"
+DEVICES_FILE = CONFIG_DIR / "devices.json"
+URL_INFO_DEFAULT_TTL = 3600
+URL_INFO_EXPIRY_MARGIN = 300
+URL_INFO_CACHE_MAX_ENTRIES = 1000
+YTDLP_WORKERS = 3
+WEB_FORMAT_PREFERENCES = [('best', "Bästa (video och ljud)"), ('1080', "Högst 1080p"), ('720', "Högst 720p"),
+                          ('480', "Högst 480p"), ('audio', "Endast ljud")]
+LIBRARY_PAGE_SIZE = 500
+THUMBNAIL_CACHE_MAX_BYTES = 512 * 1024 * 1024
+TRANSCODE_CACHE_DEFAULT_MB = 4096
+IMAGE_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+IMAGE_MEMORY_CACHE_BYTES = 96 * 1024 * 1024
+REMOTE_CACHE_MAX_BYTES = 2048 * 1024 * 1024
+REMOTE_CHUNK_SIZE = 1024 * 1024
+REMOTE_READAHEAD_CHUNKS = 8
+REMOTE_FETCH_WORKERS = 4
+REMOTE_FETCH_TIMEOUT = 20
+REMOTE_SOURCE_SESSIONS = 2
 
 # --- Filtyper som stöds ---
 VALID_MEDIA_EXT = ('.mp4', '.mkv', '.avi', '.mov', '.mp3', '.flac', '.m4a')
 VALID_IMAGE_EXT = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp')
 ALL_SUPPORTED_EXT = VALID_MEDIA_EXT + VALID_IMAGE_EXT
+AUDIO_ONLY_EXT = ('.mp3', '.flac', '.m4a')
+THUMBNAIL_WIDTH = 256
+PHOTO_THUMBNAIL_SIZE = (128, 128)
+HLS_SEGMENT_SECONDS = 6
+PREFETCH_DELAY_MS = 5000
+STATE_SAVE_INTERVAL_MS = 5000
+DISCOVERY_SETTLE_MS = 5000
+RESUME_MIN_SECONDS = 10
+RESUME_END_MARGIN_SECONDS = 30
+RESUME_GRANULARITY_SECONDS = 5
+RESUME_MAX_ENTRIES = 1000
+WATCH_POLL_SECONDS = 30
+WATCH_SETTLE_SECONDS = 1.0
+ABR_LADDER = [(1080, 5000), (720, 2800), (480, 1200)]  # (höjd, video-kbit/s)
+HLS_AUDIO_KBPS = 128
+IMAGE_PREFETCH_COUNT = 3
+RECEIVER_RESOLUTION_HD = (1920, 1080)
+RECEIVER_RESOLUTION_UHD = (3840, 2160)
 
 
 # --- Teman (QSS) ---
@@ -61,16 +135,16 @@ THEMES = {
         QWidget { background-color: #f0f0f0; color: #000000; font-size: 8pt; }
         QPushButton { background-color: #e0e0e0; border: 1px solid #c0c0c0; padding: 5px; border-radius: 3px; }
         QPushButton:hover { background-color: #d0d0d0; }
-        QListWidget, QComboBox, QSpinBox, QLineEdit { background-color: #ffffff; border: 1px solid #c0c0c0; }
-        QListWidget::item { padding: 5px; }
+        QListView, QComboBox, QSpinBox, QLineEdit { background-color: #ffffff; border: 1px solid #c0c0c0; }
+        QListView::item { padding: 5px; }
         QSlider::groove:horizontal { border: 1px solid #bbb; background: white; height: 8px; border-radius: 4px; }
         QSlider::handle:horizontal { background: #d0d0d0; border: 1px solid #a0a0a0; width: 14px; margin: -4px 0; border-radius: 7px; }
     """,
     "Mörkt": """
         QWidget { background-color: #2b2b2b; color: #ffffff; font-size: 8pt; }
-        QListWidget, QComboBox, QLineEdit, QSpinBox { background-color: #3c3c3c; color: #ffffff; border: 1px solid #555; }
-        QListWidget::item { padding: 5px; }
-        QListWidget::item:selected { background-color: #555; }
+        QListView, QComboBox, QLineEdit, QSpinBox { background-color: #3c3c3c; color: #ffffff; border: 1px solid #555; }
+        QListView::item { padding: 5px; }
+        QListView::item:selected { background-color: #555; }
         QPushButton { background-color: #555; color: #ffffff; border: 1px solid #777; padding: 5px; border-radius: 3px; }
         QPushButton:hover { background-color: #666; }
         QLabel { color: #ffffff; }
@@ -81,17 +155,17 @@ THEMES = {
         QWidget { background-color: #261D4C; color: #F6019D; font-family: 'Lucida Console', 'Courier New', monospace; font-size: 8pt; }
         QPushButton, QComboBox, QSpinBox, QLineEdit { background-color: #1A1433; color: #00F6F7; border: 2px solid #F6019D; border-radius: 5px; padding: 5px; }
         QPushButton:hover { background-color: #F6019D; color: #1A1433; }
-        QListWidget { background-color: #1A1433; color: #00F6F7; border: 2px solid #00F6F7; }
-        QListWidget::item:selected { background-color: #F6019D; color: #261D4C; }
+        QListView { background-color: #1A1433; color: #00F6F7; border: 2px solid #00F6F7; }
+        QListView::item:selected { background-color: #F6019D; color: #261D4C; }
         QLabel { color: #F6019D; }
         QSlider::groove:horizontal { height: 10px; background: qlineargradient(x1:0, y1:0, x2:1, y2:0, stop:0 #00F6F7, stop:1 #F6019D); border-radius: 5px; }
         QSlider::handle:horizontal { background: #FFFFFF; border: 1px solid #261D4C; width: 16px; margin: -4px 0; border-radius: 8px; }
     """,
     "Dracula": """
         QWidget { background-color: #282a36; color: #f8f8f2; font-size: 8pt; }
-        QListWidget, QComboBox, QLineEdit, QSpinBox { background-color: #282a36; color: #f8f8f2; border: 1px solid #6272a4; selection-background-color: #44475a; }
-        QListWidget::item { padding: 5px; }
-        QListWidget::item:selected { background-color: #44475a; border: 1px solid #bd93f9; }
+        QListView, QComboBox, QLineEdit, QSpinBox { background-color: #282a36; color: #f8f8f2; border: 1px solid #6272a4; selection-background-color: #44475a; }
+        QListView::item { padding: 5px; }
+        QListView::item:selected { background-color: #44475a; border: 1px solid #bd93f9; }
         QPushButton { background-color: #44475a; color: #f8f8f2; border: 1px solid #6272a4; padding: 5px; border-radius: 3px; }
         QPushButton:hover { background-color: #6272a4; }
         QLabel { color: #f8f8f2; }
@@ -102,8 +176,8 @@ THEMES = {
     """,
     "Matrix": """
         QWidget { background-color: #000000; color: #00FF00; font-family: 'Courier New', Courier, monospace; font-size: 8pt; }
-        QPushButton, QComboBox, QListWidget, QSpinBox, QLineEdit { background-color: #0D0D0D; color: #00FF00; border: 1px solid #00FF00; }
-        QListWidget::item:selected { background-color: #00FF00; color: #000000; }
+        QPushButton, QComboBox, QListView, QSpinBox, QLineEdit { background-color: #0D0D0D; color: #00FF00; border: 1px solid #00FF00; }
+        QListView::item:selected { background-color: #00FF00; color: #000000; }
         QPushButton:hover { background-color: #00FF00; color: #000000; }
         QLabel { color: #00FF00; }
         QSlider::groove:horizontal { border: 1px solid #00FF00; height: 4px; background: #0D0D0D; }
@@ -134,6 +208,52 @@ class Worker(QRunnable):
         finally:
             self.signals.finished.emit()
 
+class ScanSignals(QObject):
+    batch = pyqtSignal(list)
+    finished = pyqtSignal()
+
+class DirectoryScanner(QRunnable):
+    # Går igenom trädet en gång med os.scandir och skickar hittade filer i omgångar medan sökningen pågår.
+    BATCH_SIZE = 256
+    BATCH_INTERVAL = 0.25
+
+    def __init__(self, root, extensions=ALL_SUPPORTED_EXT):
+        super(DirectoryScanner, self).__init__()
+        self.root = root
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.cancelled = False
+        self.signals = ScanSignals()
+
+    @pyqtSlot()
+    def run(self):
+        batch, last_emit = [], time.monotonic()
+        stack = [self.root]
+        try:
+            while stack and not self.cancelled:
+                directory = stack.pop()
+                try:
+                    with os.scandir(directory) as it:
+                        entries = sorted(it, key=lambda e: e.name.lower())
+                except OSError:
+                    continue
+                subdirs = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions):
+                            batch.append(entry.path)
+                    except OSError:
+                        continue
+                stack.extend(reversed(subdirs))
+                if batch and (len(batch) >= self.BATCH_SIZE or time.monotonic() - last_emit >= self.BATCH_INTERVAL):
+                    self.signals.batch.emit(batch)
+                    batch, last_emit = [], time.monotonic()
+            if batch and not self.cancelled:
+                self.signals.batch.emit(batch)
+        finally:
+            self.signals.finished.emit()
+
 class StatusListener(MediaStatusListener):
     def __init__(self, main_window):
         self.main_window = main_window
@@ -148,12 +268,533 @@ class StatusListener(MediaStatusListener):
         else:
             print(f"Ignorerar ofarligt laddningsfel (felkod: None), session: {media_session_id}")
 
+def connect_cast(cast):
+    cast.wait(timeout=10)
+    return cast
+
+def connect_known_device(host):
+    # Direktanslutning till senast kända adress (host, port, uuid, modell, namn); None om enheten inte svarar där.
+    cast = pychromecast.get_chromecast_from_host(host)
+    connect_cast(cast)
+    if cast.status is None:
+        cast.disconnect()
+        return None
+    return cast
+
+class DiscoverySignals(QObject):
+    device_found = pyqtSignal(object)  # CastInfo
+    device_lost = pyqtSignal(str)  # uuid
+
+class DeviceDiscovery:
+    # Kontinuerlig mDNS-sökning i bakgrunden. CastBrowser anropar från zeroconfs trådar; allt skickas
+    # vidare som signaler så att enhetslistan bara ändras i GUI-tråden.
+    # CastBrowser.stop_discovery() stänger zeroconf-instansen, som Chromecast-objekten i enhetslistan också
+    # använder. Därför får CastBrowser ingen egen instans; mDNS-webbläsaren skapas här och kan startas om
+    # separat, och zeroconf stängs först när programmet avslutas.
+    SERVICE_TYPE = "_googlecast._tcp.local."
+
+    def __init__(self):
+        self.signals = DiscoverySignals()
+        self.zconf = None
+        self.browser = None
+        self.service_browser = None
+
+    def start(self):
+        self.zconf = zeroconf.Zeroconf()
+        self.browser = CastBrowser(SimpleCastListener(self._found, self._lost, self._found))
+        self.browser.start_discovery()
+        self._start_service_browser()
+
+    def _start_service_browser(self):
+        self.service_browser = zeroconf.ServiceBrowser(self.zconf, self.SERVICE_TYPE, self.browser.zeroconf_listener)
+
+    def _cancel_service_browser(self):
+        if self.service_browser:
+            try: self.service_browser.cancel()
+            except RuntimeError as e: print(f"Fel vid stopp av discovery: {e}")
+        self.service_browser = None
+
+    def restart(self):
+        # En ny mDNS-fråga från början; enheter som redan är kända rapporteras igen och sorteras bort av mottagaren.
+        self._cancel_service_browser()
+        self._start_service_browser()
+
+    def stop(self):
+        self._cancel_service_browser()
+        if self.browser:
+            try: self.browser.stop_discovery()
+            except Exception as e: print(f"Fel vid stopp av discovery: {e}")
+        if self.zconf: self.zconf.close()
+        self.browser, self.zconf = None, None
+
+    def _found(self, uuid, service):
+        cast_info = self.browser.devices.get(uuid) if self.browser else None
+        if cast_info and cast_info.cast_type != 'group': self.signals.device_found.emit(cast_info)
+
+    def _lost(self, uuid, service, cast_info):
+        self.signals.device_lost.emit(str(uuid))
+
 
 class Communication(QObject):
     media_status_update = pyqtSignal(MediaStatus)
     remote_command = pyqtSignal(str, object)
     media_load_error = pyqtSignal(str, str)
 
+# --- Sökindex för spellistan ---
+def normalize_search_text(text):
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(ch for ch in text if not unicodedata.combining(ch))
+
+class WatchSignals(QObject):
+    changed = pyqtSignal(list, list)  # (nya eller ändrade filer, borttagna filer/mappar)
+
+class FolderWatcher:
+    # Bevakar ett mappträd och rapporterar ändringar i omgångar. På Linux används inotify via ctypes;
+    # annars (eller om inotify inte går att starta) jämförs en ögonblicksbild av trädet med jämna mellanrum.
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x400, 0x4000, 0x8000, 0x40000000
+    IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+    WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, root, extensions=ALL_SUPPORTED_EXT):
+        self.root = os.path.abspath(root)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.signals = WatchSignals()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def is_media(self, path):
+        return path.lower().endswith(self.extensions)
+
+    def run(self):
+        libc = self.load_libc() if sys.platform.startswith('linux') else None
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC) if libc else -1
+        if fd < 0:
+            self.run_polling()
+            return
+        try: complete = self.run_inotify(libc, fd)
+        finally: os.close(fd)
+        # Trädet kunde inte bevakas helt (t.ex. max_user_watches nått): hela bevakningen går över till avläsning.
+        if not complete: self.run_polling()
+
+    @staticmethod
+    def load_libc():
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            return libc
+        except (OSError, AttributeError):
+            return None
+
+    def snapshot(self, root=None):
+        files, stack = {}, [root or self.root]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False): stack.append(entry.path)
+                            elif self.is_media(entry.name):
+                                st = entry.stat()
+                                files[entry.path] = (st.st_size, st.st_mtime_ns)
+                        except OSError: continue
+            except OSError: continue
+        return files
+
+    def run_polling(self):
+        previous = self.snapshot()
+        while not self.stop_event.wait(WATCH_POLL_SECONDS):
+            current = self.snapshot()
+            changed = [p for p, stat in current.items() if previous.get(p) != stat]
+            removed = [p for p in previous if p not in current]
+            previous = current
+            if changed or removed: self.signals.changed.emit(changed, removed)
+
+    def run_inotify(self, libc, fd):
+        watches = {}
+
+        def add_tree(root):
+            for dirpath, _, _ in os.walk(root):
+                wd = libc.inotify_add_watch(fd, os.fsencode(dirpath), self.WATCH_MASK)
+                if wd >= 0: watches[wd] = dirpath
+                else:
+                    err = ctypes.get_errno()
+                    if err == errno.ENOENT: continue  # Mappen försvann under genomgången.
+                    print(f"Kunde inte bevaka {dirpath} ({os.strerror(err)}), byter till avläsning av mappen.")
+                    return False
+            return True
+
+        if not add_tree(self.root): return False
+        changed, removed, last_event, complete = set(), set(), 0.0, True
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([fd], [], [], WATCH_SETTLE_SECONDS)
+            if readable:
+                try: data = os.read(fd, 64 * 1024)
+                except BlockingIOError: data = b''
+                pos = 0
+                while pos + self.EVENT.size <= len(data):
+                    wd, mask, _, length = self.EVENT.unpack_from(data, pos)
+                    name = os.fsdecode(data[pos + self.EVENT.size:pos + self.EVENT.size + length].rstrip(b'\x00'))
+                    pos += self.EVENT.size + length
+                    if mask & self.IN_Q_OVERFLOW:
+                        # Kön svämmade över: läs in hela trädet igen, dubbletter sorteras bort av mottagaren.
+                        changed.update(self.snapshot())
+                        continue
+                    if mask & self.IN_IGNORED:
+                        watches.pop(wd, None)
+                        continue
+                    if wd not in watches: continue
+                    path = os.path.join(watches[wd], name) if name else watches[wd]
+                    if mask & self.IN_ISDIR or mask & self.IN_DELETE_SELF:
+                        if mask & (self.IN_CREATE | self.IN_MOVED_TO):
+                            complete = complete and add_tree(path)
+                            changed.update(self.snapshot(path))
+                        elif mask & (self.IN_DELETE | self.IN_MOVED_FROM | self.IN_DELETE_SELF):
+                            removed.add(path)
+                    elif self.is_media(name):
+                        if mask & (self.IN_CLOSE_WRITE | self.IN_MOVED_TO):
+                            changed.add(path)
+                            removed.discard(path)
+                        elif mask & (self.IN_DELETE | self.IN_MOVED_FROM):
+                            removed.add(path)
+                            changed.discard(path)
+                last_event = time.monotonic()
+                if not complete:
+                    # Resten av bufferten är redan läst; det som samlats skickas innan avläsningen tar över.
+                    if changed or removed: self.signals.changed.emit(sorted(changed), sorted(removed))
+                    return False
+            # Händelser samlas tills det varit tyst en stund, så att en kopiering blir en enda omgång.
+            if (changed or removed) and time.monotonic() - last_event >= WATCH_SETTLE_SECONDS:
+                self.signals.changed.emit(sorted(changed), sorted(removed))
+                changed, removed = set(), set()
+        return True
+
+class ImportTask:
+    def __init__(self, item):
+        self.item = item
+        self.priority = None
+        self.running = False
+        self.token = CancelToken()
+
+class ImportSignals(QObject):
+    finished = pyqtSignal(object, object)
+
+class ImportJob(QRunnable):
+    def __init__(self, task, cookies_path=None):
+        super(ImportJob, self).__init__()
+        self.task = task
+        self.cookies_path = cookies_path
+        self.signals = ImportSignals()
+
+    @pyqtSlot()
+    def run(self):
+        info = None
+        if not self.task.token.cancelled:
+            item = self.task.item
+            if item.get('type') == 'web': info = refresh_web_item(item, self.cookies_path)
+            else: info = get_info(item['src'], is_url=False, cancel=self.task.token)
+        self.signals.finished.emit(self.task, info)
+
+class ImportScheduler(QObject):
+    # Begränsad och prioriterad analys av lokala filer (och förnyelse av sparade webbposter). All tillståndshantering sker i GUI-tråden;
+    # bara själva probningen körs i poolen. Antalet samtidiga probningar justeras efter uppmätt
+    # genomströmning så att en mättad disk eller CPU inte får fler processer än den hinner med.
+    URGENT, VISIBLE, NORMAL = 0, 1, 2
+    WINDOW = 16
+
+    item_ready = pyqtSignal(object, object)
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        cores = os.cpu_count() or 2
+        self.min_limit, self.max_limit = 1, cores * 2
+        self.limit = max(2, cores // 2)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(self.max_limit)
+        self.heap, self.tasks = [], {}
+        self.running, self.seq = 0, 0
+        self.done, self.total = 0, 0
+        self.window_started, self.window_done = time.monotonic(), 0
+        self.last_rate, self.direction = None, 1
+        self.cookies_path = None
+
+    def submit(self, items, priority=NORMAL):
+        if not self.running: self.window_started, self.window_done = time.monotonic(), 0
+        for v in items:
+            task = ImportTask(v)
+            self.tasks[id(v)] = task
+            self._push(task, priority)
+        self.total += len(items)
+        self._dispatch()
+        self.progress.emit(self.done, self.total)
+
+    def _push(self, task, priority):
+        task.priority = priority
+        self.seq += 1
+        heapq.heappush(self.heap, (priority, self.seq, task))
+
+    def prioritize(self, items, priority):
+        # Gamla köposter lämnas kvar och hoppas över när de plockas (lat borttagning).
+        for v in items:
+            task = self.tasks.get(id(v))
+            if task and not task.running and priority < task.priority: self._push(task, priority)
+        self._dispatch()
+
+    def is_pending(self, v):
+        return id(v) in self.tasks
+
+    def cancel(self, items):
+        for v in items:
+            task = self.tasks.pop(id(v), None)
+            if task:
+                task.token.cancel()
+                self.total -= 1
+        self._finish_batch()
+
+    def cancel_all(self):
+        for task in self.tasks.values(): task.token.cancel()
+        self.tasks.clear()
+        self.heap.clear()
+        self._finish_batch()
+
+    def _finish_batch(self):
+        if not self.tasks: self.done = self.total = 0
+        self.progress.emit(self.done, self.total)
+
+    def _dispatch(self):
+        while self.running < self.limit and self.heap:
+            priority, _, task = heapq.heappop(self.heap)
+            if task.running or priority != task.priority or self.tasks.get(id(task.item)) is not task: continue
+            task.running = True
+            self.running += 1
+            job = ImportJob(task, self.cookies_path)
+            job.signals.finished.connect(self._on_finished)
+            self.pool.start(job)
+
+    def _on_finished(self, task, info):
+        self.running -= 1
+        if self.tasks.get(id(task.item)) is task:
+            del self.tasks[id(task.item)]
+            self.done += 1
+            self._adapt()
+            self.item_ready.emit(task.item, info)
+        self._finish_batch()
+        self._dispatch()
+
+    def _adapt(self):
+        # Bergsklättring: fortsätt åt samma håll så länge genomströmningen ökar, vänd när den sjunker.
+        self.window_done += 1
+        if self.window_done < self.WINDOW: return
+        now = time.monotonic()
+        rate = self.window_done / max(now - self.window_started, 1e-3)
+        if self.last_rate is not None and rate < self.last_rate * 0.95: self.direction = -self.direction
+        self.limit = min(self.max_limit, max(self.min_limit, self.limit + self.direction))
+        self.last_rate, self.window_started, self.window_done = rate, now, 0
+
+class SearchIndex:
+    # Normaliserad text (titel, lokal sökväg, original-URL) per post, nycklad på id(video).
+    # Sökning sker med str.find i en sammanslagen korpus, som byggs om först när den behövs.
+    SEPARATOR = '\x00'
+
+    def __init__(self):
+        self.texts = {}
+        self.corpus = None
+
+    @staticmethod
+    def text_for(v):
+        parts = [v.get('title') or '']
+        if v.get('type') == 'local': parts.append(v.get('src') or '')
+        if v.get('original_url'): parts.append(v['original_url'])
+        return normalize_search_text(' '.join(parts))
+
+    def add(self, items):
+        for v in items: self.texts[id(v)] = self.text_for(v)
+        self.corpus = None
+
+    def remove(self, items):
+        for v in items: self.texts.pop(id(v), None)
+        self.corpus = None
+
+    def clear(self):
+        self.texts.clear()
+        self.corpus = None
+
+    def _build_corpus(self):
+        keys, starts, parts, offset = [], [], [], 0
+        for key, text in self.texts.items():
+            keys.append(key)
+            starts.append(offset)
+            parts.append(text)
+            offset += len(text) + 1
+        self.corpus = (self.SEPARATOR.join(parts), starts, keys)
+        return self.corpus
+
+    def search(self, query, within=None):
+        if within is not None:
+            return {k for k in within if k in self.texts and query in self.texts[k]}
+        corpus, starts, keys = self.corpus or self._build_corpus()
+        found = set()
+        pos = corpus.find(query)
+        while pos != -1:
+            i = bisect.bisect_right(starts, pos) - 1
+            found.add(keys[i])
+            pos = corpus.find(query, starts[i + 1]) if i + 1 < len(starts) else -1
+        return found
+
+class PlaylistModel(QAbstractListModel):
+    # Modell direkt ovanpå MainWindow.videos. Ikoner laddas först när en rad faktiskt ritas.
+    ROWS_MIME_TYPE = 'application/x-pycast-rows'
+    ICON_CACHE_SIZE = 1024
+
+    videos_moved = pyqtSignal(list, list)
+
+    def __init__(self, videos, parent=None):
+        super().__init__(parent)
+        self.videos = videos
+        self.filter_fn = None
+        self.visible_rows = None  # None = ofiltrerad, annars sorterade index i self.videos
+        self.icon_cache = OrderedDict()
+
+    @staticmethod
+    def display_text(v):
+        return f"{v.get('title', 'Okänd Titel')}\n({v.get('length_str', '--:--')})"
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid(): return 0
+        return len(self.videos) if self.visible_rows is None else len(self.visible_rows)
+
+    def video_index(self, row):
+        if self.visible_rows is None:
+            return row if 0 <= row < len(self.videos) else -1
+        return self.visible_rows[row] if 0 <= row < len(self.visible_rows) else -1
+
+    def row_of(self, video_index):
+        if self.visible_rows is None:
+            return video_index if 0 <= video_index < len(self.videos) else -1
+        pos = bisect.bisect_left(self.visible_rows, video_index)
+        return pos if pos < len(self.visible_rows) and self.visible_rows[pos] == video_index else -1
+
+    def data(self, index, role=Qt.DisplayRole):
+        i = self.video_index(index.row()) if index.isValid() else -1
+        if i < 0: return None
+        v = self.videos[i]
+        if role == Qt.DisplayRole: return self.display_text(v)
+        if role == Qt.DecorationRole: return self.icon_for(v.get('thumbnail_path'))
+        if role == Qt.ToolTipRole: return v.get('original_url') or v.get('src')
+        return None
+
+    def icon_for(self, path):
+        if not path: return None
+        icon = self.icon_cache.get(path)
+        if icon is None:
+            icon = QIcon(path)
+            self.icon_cache[path] = icon
+            if len(self.icon_cache) > self.ICON_CACHE_SIZE: self.icon_cache.popitem(last=False)
+        else:
+            self.icon_cache.move_to_end(path)
+        return icon
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsDropEnabled if self.visible_rows is None else Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsDragEnabled
+
+    def supportedDropActions(self):
+        return Qt.MoveAction
+
+    def mimeTypes(self):
+        return [self.ROWS_MIME_TYPE]
+
+    def mimeData(self, indexes):
+        mime = QMimeData()
+        rows = sorted({self.video_index(i.row()) for i in indexes if i.isValid()})
+        mime.setData(self.ROWS_MIME_TYPE, json.dumps(rows).encode('utf-8'))
+        return mime
+
+    def dropMimeData(self, data, action, row, column, parent):
+        if self.visible_rows is not None or not data.hasFormat(self.ROWS_MIME_TYPE): return False
+        rows = json.loads(bytes(data.data(self.ROWS_MIME_TYPE)).decode('utf-8'))
+        if row == -1: row = parent.row() if parent.isValid() else len(self.videos)
+        dest = row - sum(1 for r in rows if r < row)
+        order = list(range(len(self.videos)))
+        for r in reversed(rows): order.pop(r)
+        order[dest:dest] = rows
+        self.beginResetModel()
+        self.videos[:] = [self.videos[i] for i in order]
+        self.endResetModel()
+        new_positions = [0] * len(order)
+        for new, old in enumerate(order): new_positions[old] = new
+        self.videos_moved.emit(new_positions, rows)
+        # False hindrar vyn från att ta bort källraderna – flytten är redan gjord här.
+        return False
+
+    def _apply_filter(self):
+        if self.filter_fn is None:
+            self.visible_rows = None
+        else:
+            self.visible_rows = [i for i, v in enumerate(self.videos) if self.filter_fn(v)]
+
+    def set_filter(self, filter_fn):
+        self.beginResetModel()
+        self.filter_fn = filter_fn
+        self._apply_filter()
+        self.endResetModel()
+
+    def reset(self):
+        self.beginResetModel()
+        self._apply_filter()
+        self.endResetModel()
+
+    def append_videos(self, items):
+        if not items: return
+        first = len(self.videos)
+        if self.visible_rows is None:
+            self.beginInsertRows(QModelIndex(), first, first + len(items) - 1)
+            self.videos.extend(items)
+            self.endInsertRows()
+            return
+        self.videos.extend(items)
+        matches = [first + n for n, v in enumerate(items) if self.filter_fn(v)]
+        if matches:
+            start = len(self.visible_rows)
+            self.beginInsertRows(QModelIndex(), start, start + len(matches) - 1)
+            self.visible_rows.extend(matches)
+            self.endInsertRows()
+
+    def remove_videos(self, indices):
+        removed = []
+        if self.visible_rows is None:
+            for i in sorted(indices, reverse=True):
+                self.beginRemoveRows(QModelIndex(), i, i)
+                removed.append(self.videos.pop(i))
+                self.endRemoveRows()
+        else:
+            self.beginResetModel()
+            for i in sorted(indices, reverse=True): removed.append(self.videos.pop(i))
+            self._apply_filter()
+            self.endResetModel()
+        return removed
+
+    def refresh(self):
+        # Analyserade platshållare ritas om; vyn hämtar bara data för de rader som syns.
+        if self.rowCount(): self.dataChanged.emit(self.index(0), self.index(self.rowCount() - 1))
+
+    def clear(self):
+        self.beginResetModel()
+        self.videos.clear()
+        self._apply_filter()
+        self.endResetModel()
+
 class FormatSelectorDialog(QDialog):
     def __init__(self, formats, parent=None):
         super().__init__(parent)
@@ -208,9 +849,338 @@ class EQDialog(QDialog):
             self.settings[f"eq_{band}"] = slider.value()
         super().accept()
 
+def write_file_atomic(path, data, sync=False):
+    # Unikt temporärt namn i samma katalog, så att samtidiga skrivare av samma fil inte delar .tmp-fil; os.replace är atomiskt.
+    # sync=True tvingar ut datan till disken innan bytet, så att filen överlever även ett strömavbrott.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+# --- Metadata-cache för lokala filer ---
+# Nyckel: absolut sökväg. En post gäller bara så länge filens storlek och mtime är oförändrade.
+class MetadataCache:
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.entries = None
+        self.dirty = False
+
+    def _ensure_loaded(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f: self.entries = json.load(f)
+            except (IOError, json.JSONDecodeError): self.entries = {}
+
+    @staticmethod
+    def file_key(media_source):
+        abs_path = os.path.abspath(media_source)
+        st = os.stat(abs_path)
+        return abs_path, st.st_size, st.st_mtime_ns
+
+    def get(self, media_source):
+        try: abs_path, size, mtime = self.file_key(media_source)
+        except OSError: return None
+        with self.lock:
+            self._ensure_loaded()
+            entry = self.entries.get(abs_path)
+        if not entry or entry.get('size') != size or entry.get('mtime') != mtime:
+            return None
+        thumb = entry.get('thumbnail_path')
+        if thumb and not os.path.exists(thumb):
+            return None
+        return entry
+
+    def put(self, media_source, meta):
+        try: abs_path, size, mtime = self.file_key(media_source)
+        except OSError: return
+        entry = dict(meta, size=size, mtime=mtime)
+        with self.lock:
+            self._ensure_loaded()
+            self.entries[abs_path] = entry
+            self.dirty = True
+
+    def discard(self, path):
+        # Tar bort posten för en fil, eller alla poster under en borttagen mapp.
+        prefix = os.path.join(os.path.abspath(path), '')
+        with self.lock:
+            self._ensure_loaded()
+            stale = [k for k in self.entries if k == prefix[:-1] or k.startswith(prefix)]
+            for k in stale: del self.entries[k]
+            if stale: self.dirty = True
+
+    def save(self):
+        # Timern kan starta en ny sparning innan en långsam föregående är klar; de körs i tur och ordning.
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty: return
+                snapshot = dict(self.entries)
+                self.dirty = False
+            try:
+                write_file_atomic(self.path, json.dumps(snapshot).encode('utf-8'))
+            except Exception as e:
+                print(f"Kunde inte spara metadata-cache: {e}")
+                with self.lock: self.dirty = True
+
+METADATA_CACHE = MetadataCache(METADATA_CACHE_FILE)
+
+# --- Inställningar och återupptagningspunkter ---
+class JsonStateFile:
+    # En JSON-fil som speglar en levande dict. GUI-tråden tar bara en grund kopia när innehållet ändrats; skrivningen
+    # sker i bakgrunden och atomiskt (.tmp, fsync, os.replace), så en krasch lämnar alltid en hel fil.
+    # Värdena i dicten byts ut vid ändring och muteras aldrig på plats, annars syns inte ändringen i jämförelsen.
+    def __init__(self, path, data):
+        self.path = Path(path)
+        self.data = data
+        self.last_snapshot = dict(data)
+        self.generation = 0
+        self.saved_generation = 0
+        self.write_lock = threading.Lock()
+
+    def take_snapshot(self):
+        # (generation, kopia) om något ändrats sedan förra gången, annars None.
+        if self.data == self.last_snapshot: return None
+        self.last_snapshot = dict(self.data)
+        self.generation += 1
+        return self.generation, self.last_snapshot
+
+    def write(self, generation, snapshot):
+        # En långsam skrivning får inte skriva över en nyare som hunnit före.
+        with self.write_lock:
+            if generation <= self.saved_generation: return
+            try:
+                write_file_atomic(self.path, json.dumps(snapshot, indent=2).encode('utf-8'), sync=True)
+                self.saved_generation = generation
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Kunde inte spara {self.path.name}: {e}")
+                self.last_snapshot = None
+
+    def save(self):
+        pending = self.take_snapshot()
+        if pending: self.write(*pending)
+
+def resume_key(media_data):
+    return media_data.get('original_url') or media_data['src']
+
+# --- Bibliotek och spellistor i SQLite ---
+class LibraryStore:
+    # Fullständig probad metadata per media (lokal sökväg eller original-URL) och namngivna spellistor
+    # som refererar till den. Spellistor läses sida för sida via indexet på (playlist_id, position).
+    PERSISTED_FIELDS = ('src', 'type', 'title', 'length', 'length_str', 'thumbnail_path', 'streams', 'container',
+                        'media_type', 'audio_codec', 'original_url', 'format_id', 'format_pref', 'protocol', 'id', 'subtitle_path')
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS media (
+            key TEXT PRIMARY KEY, type TEXT NOT NULL, size INTEGER, mtime INTEGER, info TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS playlists (
+            id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL, updated REAL);
+        CREATE TABLE IF NOT EXISTS playlist_items (
+            playlist_id INTEGER NOT NULL REFERENCES playlists(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL, media_key TEXT NOT NULL, rotation INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (playlist_id, position)) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS playlist_items_media ON playlist_items(media_key);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = None
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(str(self.path))
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA foreign_keys=ON")
+            self.conn.executescript(self.SCHEMA)
+        return self.conn
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    @staticmethod
+    def media_key(v):
+        return os.path.abspath(v['src']) if v.get('type') == 'local' else v.get('original_url') or v['src']
+
+    def media_row(self, v):
+        size = mtime = None
+        if v.get('type') == 'local' and not v.get('pending'):
+            try:
+                st = os.stat(v['src'])
+                size, mtime = st.st_size, st.st_mtime_ns
+            except OSError: pass
+        info = {k: v[k] for k in self.PERSISTED_FIELDS if v.get(k) is not None}
+        return self.media_key(v), v.get('type'), size, mtime, json.dumps(info)
+
+    def playlist_names(self):
+        return [r[0] for r in self.connect().execute("SELECT name FROM playlists ORDER BY updated DESC")]
+
+    def save_playlist(self, name, videos):
+        conn = self.connect()
+        with conn:
+            # Poster som fortfarande analyseras får inte skriva över tidigare sparad metadata.
+            conn.executemany("INSERT OR REPLACE INTO media (key, type, size, mtime, info) VALUES (?, ?, ?, ?, ?)",
+                             (self.media_row(v) for v in videos if not v.get('pending')))
+            conn.executemany("INSERT OR IGNORE INTO media (key, type, size, mtime, info) VALUES (?, ?, ?, ?, ?)",
+                             (self.media_row(v) for v in videos if v.get('pending')))
+            conn.execute("INSERT INTO playlists (name, updated) VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET updated = excluded.updated",
+                         (name, time.time()))
+            playlist_id = conn.execute("SELECT id FROM playlists WHERE name = ?", (name,)).fetchone()[0]
+            conn.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (playlist_id,))
+            conn.executemany("INSERT INTO playlist_items (playlist_id, position, media_key, rotation) VALUES (?, ?, ?, ?)",
+                             ((playlist_id, i, self.media_key(v), v.get('rotation', 0)) for i, v in enumerate(videos)))
+
+    def playlist_page(self, name, offset, limit):
+        # Returnerar [(info, size, mtime, rotation)] för positionerna offset..offset+limit.
+        rows = self.connect().execute(
+            """SELECT m.info, m.size, m.mtime, i.rotation FROM playlist_items i
+               JOIN playlists p ON p.id = i.playlist_id JOIN media m ON m.key = i.media_key
+               WHERE p.name = ? AND i.position >= ? ORDER BY i.position LIMIT ?""", (name, offset, limit))
+        return [(json.loads(info), size, mtime, rotation) for info, size, mtime, rotation in rows]
+
+LIBRARY = LibraryStore(LIBRARY_DB_FILE)
+
+def find_stale_files(entries):
+    # Bakgrundskontroll efter inläsning: (ändrade, försvunna) bland [(sökväg, storlek, mtime)].
+    changed, missing = [], []
+    for path, size, mtime in entries:
+        try: st = os.stat(path)
+        except OSError:
+            missing.append(path)
+            continue
+        if size is None or st.st_size != size or st.st_mtime_ns != mtime: changed.append(path)
+    return changed, missing
+
+def refresh_web_item(item, cookies_path=None):
+    # Webbadresser från en sparad lista har gått ut, och poster från en webbspellista saknar format;
+    # formatet väljs utan dialog (samma format_id, annars enligt sparad formatpreferens).
+    info = get_info(item['original_url'], is_url=True, cookies_path=cookies_path)
+    if info.get('is_error'): return info
+    formats = info.get('formats', [])
+    fmt = next((f for f in formats if item.get('format_id') and f.get('format_id') == item['format_id']), None)
+    if not fmt and item.get('format_pref'): fmt = choose_format(formats, item['format_pref'])
+    if not fmt: fmt = next((f for f in formats if f['media_type'] == item.get('media_type')), None)
+    if not fmt: return dict(info, is_error=True, error_message="Formatet finns inte längre")
+    info.update({'src': fmt['url'], 'media_type': fmt['media_type'], 'streams': fmt.get('streams', []), 'format_id': fmt.get('format_id'),
+                 'protocol': fmt.get('protocol')})
+    return info
+
+def web_item_needs_refresh(v):
+    # Webbposter från biblioteket visas och spelas som de är tills format-URL:en gått ut (eller saknar känd giltighetstid).
+    if v.get('type') != 'web' or not v.get('stored') or v.get('pending'): return False
+    expires = format_url_expiry(v.get('src') or '')
+    return expires is None or expires - URL_INFO_EXPIRY_MARGIN <= time.time()
+
+def format_length(duration):
+    return time.strftime('%H:%M:%S' if duration >= 3600 else '%M:%S', time.gmtime(duration))
+
+def summarize_streams(streams):
+    keys = ('codec_type', 'codec_name', 'profile', 'pix_fmt', 'width', 'height', 'channels')
+    summary = []
+    for s in streams:
+        if s.get('disposition', {}).get('attached_pic'): continue
+        summary.append({k: s[k] for k in keys if s.get(k) is not None})
+    return summary
+
+def build_local_info(media_source, meta):
+    is_image = meta.get('media_type') == 'image'
+    return {
+        'src': media_source, 'type': 'local', 'title': Path(media_source).name,
+        'length': meta.get('length', 0), 'is_error': False,
+        'length_str': "Bild" if is_image else format_length(meta.get('length', 0)),
+        'thumbnail_path': meta.get('thumbnail_path'),
+        'streams': meta.get('streams', []), 'container': meta.get('container'),
+        'media_type': meta.get('media_type'), 'audio_codec': meta.get('audio_codec')
+    }
+
+# --- Diskcache med storleksbudget (LRU) ---
+# Senaste användning lagras som mtime på posten; de äldsta posterna rensas först när budgeten överskrids.
+class DiskLruStore:
+    def __init__(self, directory, max_bytes):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.total_bytes = None
+
+    def path_for(self, name):
+        return self.directory / name
+
+    def touch(self, path):
+        try: os.utime(path, None)
+        except OSError: pass
+
+    def lookup(self, name):
+        path = self.path_for(name)
+        if not path.exists(): return None
+        self.touch(path)
+        return path
+
+    @staticmethod
+    def entry_size(path):
+        try:
+            if not path.is_dir(): return path.stat().st_size
+            return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+        except OSError: return 0
+
+    def _scan(self):
+        entries = []
+        try:
+            for entry in os.scandir(self.directory):
+                path = Path(entry.path)
+                try: mtime = entry.stat().st_mtime
+                except OSError: continue
+                entries.append((mtime, self.entry_size(path), path))
+        except OSError: pass
+        return entries
+
+    def added(self, path, size=None):
+        # size anges när en post (katalog) växer stegvis; annars mäts hela posten.
+        if size is None: size = self.entry_size(Path(path))
+        with self.lock:
+            if self.total_bytes is None:
+                self.total_bytes = sum(e[1] for e in self._scan())
+            else:
+                self.total_bytes += size
+            if self.total_bytes > self.max_bytes:
+                self._evict(keep=Path(path))
+
+    def _evict(self, keep=None):
+        entries = sorted(self._scan())
+        total = sum(e[1] for e in entries)
+        target = self.max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target: break
+            if path == keep: continue
+            try:
+                if path.is_dir():
+                    for f in sorted(path.rglob('*'), reverse=True):
+                        f.rmdir() if f.is_dir() else f.unlink()
+                    path.rmdir()
+                else:
+                    path.unlink()
+                total -= size
+            except OSError: pass
+        self.total_bytes = total
+
+THUMBNAILS = DiskLruStore(THUMBNAIL_DIR, THUMBNAIL_CACHE_MAX_BYTES)
+TRANSCODE_CACHE = DiskLruStore(TRANSCODE_CACHE_DIR, TRANSCODE_CACHE_DEFAULT_MB * 1024 * 1024)
+
+def local_media_id(media_source):
+    abs_path, size, mtime = MetadataCache.file_key(media_source)
+    return hashlib.sha1(f"{abs_path}|{size}|{mtime}".encode('utf-8')).hexdigest()[:24]
+
 def get_thumbnail_path(media_id, url=None):
-    thumb_path = THUMBNAIL_DIR / f"{media_id}.jpg"
-    if thumb_path.exists(): return str(thumb_path)
+    thumb_path = THUMBNAILS.lookup(f"{media_id}.jpg")
+    if thumb_path: return str(thumb_path)
+    thumb_path = THUMBNAILS.path_for(f"{media_id}.jpg")
     if url:
         try:
             response = requests.get(url, stream=True, timeout=10)
@@ -220,30 +1190,634 @@ def get_thumbnail_path(media_id, url=None):
                 img = Image.open(thumb_path)
                 img.thumbnail((128, 128))
                 img.save(thumb_path)
+                THUMBNAILS.added(thumb_path)
                 return str(thumb_path)
         except Exception as e: print(f"Kunde inte ladda ner miniatyrbild: {e}")
     return None
 
-def get_info(media_source, is_url, cookies_path=None):
+# --- Probning och miniatyrbilder för lokala mediafiler ---
+class ProbeCancelled(Exception):
+    pass
+
+class CancelToken:
+    # Delas mellan schemaläggaren och en probning; cancel() dödar även de ffmpeg/ffprobe-processer som redan körs.
+    def __init__(self):
+        self.cancelled = False
+        self.processes = set()
+        self.lock = threading.Lock()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            processes = list(self.processes)
+        for proc in processes:
+            try: proc.kill()
+            except OSError: pass
+
+    def register(self, proc):
+        with self.lock:
+            self.processes.add(proc)
+            if self.cancelled: proc.kill()
+
+    def unregister(self, proc):
+        with self.lock: self.processes.discard(proc)
+
+def run_media_tool(cmd, timeout, cancel=None):
+    if cancel and cancel.cancelled: raise ProbeCancelled()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+    if cancel: cancel.register(proc)
+    try:
+        out, err = proc.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        out, err = proc.communicate()
+    finally:
+        if cancel: cancel.unregister(proc)
+    if cancel and cancel.cancelled: raise ProbeCancelled()
+    return proc.returncode, out, err
+
+def ffprobe_media(media_source, cancel=None):
+    cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", media_source]
+    _, out, _ = run_media_tool(cmd, timeout=15, cancel=cancel)
+    data = json.loads(out)
+    return {
+        'length': float(data.get('format', {}).get('duration', 0)),
+        'streams': summarize_streams(data.get('streams', [])),
+        'container': data.get('format', {}).get('format_name')
+    }
+
+FFMPEG_DURATION_RE = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+FFMPEG_INPUT_RE = re.compile(r"Input #0, (.+?), from ")
+FFMPEG_STREAM_RE = re.compile(r"Stream #0:\d+\S*: (Video|Audio|Subtitle|Data|Attachment): (.*)")
+FFMPEG_CHANNELS = {'mono': 1, 'stereo': 2, '2.1': 3, 'quad': 4, '4.0': 4, '5.0': 5, '5.1': 6, '6.1': 7, '7.1': 8}
+
+def split_stream_fields(desc):
+    # Delar "h264 (High), yuv420p(tv, bt709), 1920x1080" på toppnivå-komman.
+    fields, depth, current = [], 0, ''
+    for ch in desc:
+        if ch in '([': depth += 1
+        elif ch in ')]': depth -= 1
+        if ch == ',' and depth == 0:
+            fields.append(current.strip())
+            current = ''
+        else:
+            current += ch
+    if current.strip(): fields.append(current.strip())
+    return fields
+
+def parse_ffmpeg_banner(stderr_text):
+    input_part = re.split(r"Stream mapping:|Output #0", stderr_text, maxsplit=1)[0]
+    m = FFMPEG_DURATION_RE.search(input_part)
+    duration = int(m.group(1)) * 3600 + int(m.group(2)) * 60 + float(m.group(3)) if m else 0.0
+    m = FFMPEG_INPUT_RE.search(input_part)
+    streams = []
+    for sm in FFMPEG_STREAM_RE.finditer(input_part):
+        kind, desc = sm.group(1).lower(), sm.group(2)
+        if '(attached pic)' in desc: continue
+        fields = split_stream_fields(desc)
+        codec = re.match(r"(\w+)(?: \(([^)/]+)\))?", fields[0])
+        stream = {'codec_type': kind, 'codec_name': codec.group(1) if codec else fields[0]}
+        if codec and codec.group(2): stream['profile'] = codec.group(2)
+        if kind == 'video':
+            if len(fields) > 1: stream['pix_fmt'] = fields[1].split('(')[0].strip()
+            size = re.search(r"\b(\d{2,5})x(\d{2,5})\b", desc)
+            if size: stream['width'], stream['height'] = int(size.group(1)), int(size.group(2))
+        elif kind == 'audio' and len(fields) > 2:
+            layout = fields[2].split('(')[0].strip()
+            channels = re.match(r"(\d+) channels", layout)
+            stream['channels'] = int(channels.group(1)) if channels else FFMPEG_CHANNELS.get(layout)
+            if stream['channels'] is None: del stream['channels']
+        streams.append(stream)
+    return {'length': duration, 'streams': streams, 'container': m.group(1) if m else None}
+
+# --- Containerhuvuden utan ffprobe ---
+# Varaktighet och strömmar läses direkt ur huvudena via mmap. Allt som inte känns igen ger None,
+# och då får ffprobe ta över precis som tidigare.
+MP4_VIDEO_CODECS = {b'avc1': 'h264', b'avc3': 'h264', b'hvc1': 'hevc', b'hev1': 'hevc', b'vp09': 'vp9', b'av01': 'av1', b'mp4v': 'mpeg4'}
+MP4_AUDIO_CODECS = {b'mp4a': 'aac', b'ac-3': 'ac3', b'ec-3': 'eac3', b'Opus': 'opus', b'fLaC': 'flac', b'alac': 'alac', b'.mp3': 'mp3'}
+MP4_ESDS_OBJECT_TYPES = {0x40: 'aac', 0x66: 'aac', 0x67: 'aac', 0x68: 'aac', 0x69: 'mp3', 0x6B: 'mp3'}
+MKV_CODECS = {'V_MPEG4/ISO/AVC': 'h264', 'V_MPEGH/ISO/HEVC': 'hevc', 'V_VP8': 'vp8', 'V_VP9': 'vp9', 'V_AV1': 'av1',
+              'V_MPEG4/ISO/ASP': 'mpeg4', 'V_MPEG2': 'mpeg2video', 'A_AAC': 'aac', 'A_AC3': 'ac3', 'A_EAC3': 'eac3',
+              'A_DTS': 'dts', 'A_OPUS': 'opus', 'A_VORBIS': 'vorbis', 'A_FLAC': 'flac', 'A_MPEG/L3': 'mp3', 'A_TRUEHD': 'truehd'}
+AVC_420_PROFILE_IDCS = (66, 77, 88, 100)  # Baseline, Main, Extended och High är alltid 8 bitar 4:2:0
+MP3_BITRATES = {True: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+                False: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+def avc_stream_fields(avcc):
+    # avcC: version, profile_idc, ...
+    if len(avcc) < 2: return {}
+    fields = {'profile': AVC_PROFILES.get(f"{avcc[1]:02x}")}
+    if avcc[1] in AVC_420_PROFILE_IDCS: fields['pix_fmt'] = 'yuv420p'
+    return {k: v for k, v in fields.items() if v}
+
+def mp4_boxes(mm, start, end):
+    pos = start
+    while pos + 8 <= end:
+        size, kind = struct.unpack_from('>I4s', mm, pos)
+        header = 8
+        if size == 1:
+            size, header = struct.unpack_from('>Q', mm, pos + 8)[0], 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end: return
+        yield kind, pos + header, pos + size
+        pos += size
+
+def mp4_child(mm, box, *path):
+    for kind in path:
+        if box is None: return None
+        box = next(((s, e) for k, s, e in mp4_boxes(mm, *box) if k == kind), None)
+    return box
+
+def mp4_esds_codec(mm, start, end):
+    def descriptor(pos):
+        tag, length, pos = mm[pos], 0, pos + 1
+        for _ in range(4):
+            b = mm[pos]
+            pos += 1
+            length = (length << 7) | (b & 0x7F)
+            if not b & 0x80: break
+        return tag, pos
+    tag, pos = descriptor(start + 4)
+    if tag != 0x03: return None
+    flags = mm[pos + 2]
+    pos += 3
+    if flags & 0x80: pos += 2
+    if flags & 0x40: pos += 1 + mm[pos]
+    if flags & 0x20: pos += 2
+    tag, pos = descriptor(pos)
+    return MP4_ESDS_OBJECT_TYPES.get(mm[pos]) if tag == 0x04 and pos < end else None
+
+def mp4_duration(mm, start):
+    if mm[start] == 1: timescale, duration = struct.unpack_from('>IQ', mm, start + 20)
+    else: timescale, duration = struct.unpack_from('>II', mm, start + 12)
+    return duration / timescale if timescale else 0
+
+def mp4_track_stream(mm, trak):
+    hdlr = mp4_child(mm, trak, b'mdia', b'hdlr')
+    stsd = mp4_child(mm, trak, b'mdia', b'minf', b'stbl', b'stsd')
+    if not hdlr or not stsd: return None
+    handler = mm[hdlr[0] + 8:hdlr[0] + 12]
+    if handler not in (b'vide', b'soun'): return {}
+    entry = next(mp4_boxes(mm, stsd[0] + 8, stsd[1]), None)
+    if entry is None: return None
+    kind, start, end = entry
+    if handler == b'vide':
+        codec = MP4_VIDEO_CODECS.get(kind)
+        if not codec: return None
+        width, height = struct.unpack_from('>HH', mm, start + 24)
+        stream = {'codec_type': 'video', 'codec_name': codec, 'width': width, 'height': height}
+        avcc = mp4_child(mm, (start + 78, end), b'avcC') if codec == 'h264' else None
+        if avcc: stream.update(avc_stream_fields(mm[avcc[0]:avcc[1]]))
+        return stream
+    codec = MP4_AUDIO_CODECS.get(kind)
+    if not codec: return None
+    version, = struct.unpack_from('>H', mm, start + 8)
+    channels, = struct.unpack_from('>H', mm, start + 16)
+    if kind == b'mp4a':
+        esds = mp4_child(mm, (start + 28 + {1: 16, 2: 36}.get(version, 0), end), b'esds')
+        codec = mp4_esds_codec(mm, *esds) if esds else None
+        if not codec: return None
+    return {'codec_type': 'audio', 'codec_name': codec, 'channels': channels}
+
+def parse_mp4_headers(mm):
+    moov = mp4_child(mm, (0, len(mm)), b'moov')
+    if not moov: return None
+    mvhd = mp4_child(mm, moov, b'mvhd')
+    length = mp4_duration(mm, mvhd[0]) if mvhd else 0
+    if not length:
+        # Fragmenterad mp4: total längd står i mvex/mehd (mvhd:s tidsskala).
+        mehd = mp4_child(mm, moov, b'mvex', b'mehd')
+        if mvhd and mehd:
+            timescale = struct.unpack_from('>I', mm, mvhd[0] + (20 if mm[mvhd[0]] == 1 else 12))[0]
+            fragment = struct.unpack_from('>Q' if mm[mehd[0]] == 1 else '>I', mm, mehd[0] + 4)[0]
+            length = fragment / timescale if timescale else 0
+    streams = []
+    for kind, s, e in mp4_boxes(mm, *moov):
+        if kind != b'trak': continue
+        stream = mp4_track_stream(mm, (s, e))
+        if stream is None: return None
+        if stream: streams.append(stream)
+    return {'length': length, 'streams': streams, 'container': 'mov,mp4,m4a,3gp,3g2,mj2'}
+
+def ebml_vint(mm, pos, keep_marker=False):
+    first = mm[pos]
+    if not first: raise ValueError("ogiltigt EBML-tal")
+    length = 9 - first.bit_length()
+    value = first if keep_marker else first & ((1 << (8 - length)) - 1)
+    for i in range(1, length): value = (value << 8) | mm[pos + i]
+    if not keep_marker and value == (1 << (7 * length)) - 1: value = None  # okänd storlek
+    return value, pos + length
+
+def ebml_elements(mm, start, end):
+    pos = start
+    while pos < end:
+        element_id, pos = ebml_vint(mm, pos, keep_marker=True)
+        size, pos = ebml_vint(mm, pos)
+        stop = end if size is None else min(pos + size, end)
+        yield element_id, pos, stop
+        pos = stop
+
+def parse_mkv_headers(mm):
+    elements = ebml_elements(mm, 0, len(mm))
+    header = next(elements, None)
+    if not header or header[0] != 0x1A45DFA3: return None
+    segment = next(elements, None)
+    if not segment or segment[0] != 0x18538067: return None
+    scale, duration, streams, have_tracks = 1000000, 0, [], False
+    for element_id, s, e in ebml_elements(mm, segment[1], segment[2]):
+        if element_id == 0x1549A966:  # Info
+            for child, cs, ce in ebml_elements(mm, s, e):
+                if child == 0x2AD7B1: scale = int.from_bytes(mm[cs:ce], 'big')
+                elif child == 0x4489: duration = struct.unpack('>f' if ce - cs == 4 else '>d', mm[cs:ce])[0]
+        elif element_id == 0x1654AE6B:  # Tracks
+            have_tracks = True
+            for entry, ts, te in ebml_elements(mm, s, e):
+                if entry != 0xAE: continue
+                fields = {child: (cs, ce) for child, cs, ce in ebml_elements(mm, ts, te)}
+                track_type = int.from_bytes(mm[slice(*fields[0x83])], 'big') if 0x83 in fields else 0
+                if track_type not in (1, 2): continue
+                codec_id = mm[slice(*fields[0x86])].decode('ascii', 'ignore').rstrip('\x00') if 0x86 in fields else ''
+                codec = MKV_CODECS.get(codec_id) or ('aac' if codec_id.startswith('A_AAC') else None)
+                if not codec: return None
+                sub = {child: int.from_bytes(mm[cs:ce], 'big') for child, cs, ce in ebml_elements(mm, *fields.get(0xE0 if track_type == 1 else 0xE1, (0, 0)))}
+                if track_type == 1:
+                    stream = {'codec_type': 'video', 'codec_name': codec, 'width': sub.get(0xB0), 'height': sub.get(0xBA)}
+                    if codec == 'h264' and 0x63A2 in fields: stream.update(avc_stream_fields(mm[slice(*fields[0x63A2])]))
+                else:
+                    stream = {'codec_type': 'audio', 'codec_name': codec, 'channels': sub.get(0x9F, 1)}
+                streams.append({k: v for k, v in stream.items() if v is not None})
+        elif element_id == 0x1F43B675:  # Cluster: huvudena ligger före mediadatan
+            break
+    if not have_tracks: return None
+    return {'length': duration * scale / 1e9, 'streams': streams, 'container': 'matroska,webm'}
+
+def skip_id3v2(mm):
+    if mm[:3] != b'ID3': return 0
+    size = (mm[6] & 0x7F) << 21 | (mm[7] & 0x7F) << 14 | (mm[8] & 0x7F) << 7 | (mm[9] & 0x7F)
+    return 10 + size + (10 if mm[5] & 0x10 else 0)
+
+def mp3_frame_info(mm, pos):
+    # Returnerar (mpeg1, bitrate, samplerate, kanalläge, ramlängd) för ett giltigt Layer III-huvud.
+    if pos + 4 > len(mm): return None
+    h, = struct.unpack_from('>I', mm, pos)
+    version, layer, bitrate_idx, rate_idx = (h >> 19) & 3, (h >> 17) & 3, (h >> 12) & 0xF, (h >> 10) & 3
+    if h >> 21 != 0x7FF or version == 1 or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3: return None
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[mpeg1][bitrate_idx] * 1000
+    samplerate = MP3_SAMPLE_RATES[version][rate_idx]
+    frame_length = (144 if mpeg1 else 72) * bitrate // samplerate + ((h >> 9) & 1)
+    return mpeg1, bitrate, samplerate, (h >> 6) & 3, frame_length
+
+def parse_mp3_headers(mm):
+    pos = skip_id3v2(mm)
+    limit = min(len(mm) - 4, pos + 65536)
+    while pos < limit:
+        frame = mp3_frame_info(mm, pos) if mm[pos] == 0xFF else None
+        # Ett huvud räknas bara om nästa ram också börjar där den ska.
+        if frame and (pos + frame[4] + 4 > len(mm) or mp3_frame_info(mm, pos + frame[4])): break
+        pos += 1
+    else:
+        return None
+    mpeg1, bitrate, samplerate, channel_mode, _ = frame
+    samples_per_frame = 1152 if mpeg1 else 576
+    side_info = (32 if channel_mode != 3 else 17) if mpeg1 else (17 if channel_mode != 3 else 9)
+    xing = pos + 4 + side_info
+    frames = None
+    if mm[xing:xing + 4] in (b'Xing', b'Info') and struct.unpack_from('>I', mm, xing + 4)[0] & 1:
+        frames = struct.unpack_from('>I', mm, xing + 8)[0]
+    elif mm[pos + 36:pos + 40] == b'VBRI':
+        frames = struct.unpack_from('>I', mm, pos + 50)[0]
+    if frames:
+        length = frames * samples_per_frame / samplerate
+    else:
+        audio_end = len(mm) - (128 if mm[-128:-125] == b'TAG' else 0)
+        length = (audio_end - pos) * 8 / bitrate
+    return {'length': length, 'streams': [{'codec_type': 'audio', 'codec_name': 'mp3', 'channels': 1 if channel_mode == 3 else 2}], 'container': 'mp3'}
+
+def parse_flac_headers(mm):
+    pos = skip_id3v2(mm)
+    if mm[pos:pos + 4] != b'fLaC' or mm[pos + 4] & 0x7F != 0: return None
+    v = int.from_bytes(mm[pos + 18:pos + 26], 'big')
+    samplerate, channels, total = v >> 44, ((v >> 41) & 7) + 1, v & ((1 << 36) - 1)
+    if not samplerate or not total: return None
+    return {'length': total / samplerate, 'streams': [{'codec_type': 'audio', 'codec_name': 'flac', 'channels': channels}], 'container': 'flac'}
+
+HEADER_PARSERS = {'.mp4': parse_mp4_headers, '.mov': parse_mp4_headers, '.m4a': parse_mp4_headers,
+                  '.mkv': parse_mkv_headers, '.mp3': parse_mp3_headers, '.flac': parse_flac_headers}
+
+def read_media_headers(media_source):
+    parser = HEADER_PARSERS.get(Path(media_source).suffix.lower())
+    if not parser: return None
+    try:
+        with open(media_source, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            meta = parser(mm)
+    except (OSError, ValueError, IndexError, KeyError, struct.error):
+        return None
+    if not meta or not meta['length'] or not meta['streams']: return None
+    return meta
+
+def thumbnail_seek_point(duration):
+    if not duration: return 5
+    return min(max(duration * 0.1, 0), 30)
+
+def extract_thumbnail_cmd(media_source, thumb_path, seek):
+    # -ss före -i söker på indatasidan till närmaste keyframe i stället för att avkoda fram till tidpunkten.
+    return ["ffmpeg", "-hide_banner", "-ss", f"{seek:.3f}", "-i", media_source, "-map", "0:V:0?",
+            "-frames:v", "1", "-vf", f"scale={THUMBNAIL_WIDTH}:-2", "-y", str(thumb_path)]
+
+def probe_with_thumbnail(media_source, thumb_path, duration=None, cancel=None):
+    # En ffmpeg-körning ger både miniatyrbild och stream-info (ur indata-bannern på stderr).
+    seek = thumbnail_seek_point(duration)
+    _, _, err = run_media_tool(extract_thumbnail_cmd(media_source, thumb_path, seek), timeout=30, cancel=cancel)
+    meta = parse_ffmpeg_banner(err.decode('utf-8', 'ignore'))
+    if not meta['streams']:
+        meta = ffprobe_media(media_source, cancel=cancel)
+    has_video = any(s.get('codec_type') == 'video' for s in meta['streams'])
+    if has_video and not thumb_path.exists() and meta['length'] and meta['length'] < seek:
+        # Klipp kortare än standardpositionen: ta en bild från det probade klippets början.
+        run_media_tool(extract_thumbnail_cmd(media_source, thumb_path, meta['length'] * 0.25), timeout=30, cancel=cancel)
+    if thumb_path.exists(): THUMBNAILS.added(thumb_path)
+    return meta
+
+# --- Miniatyrbilder för foton (körs i en processpool) ---
+def exif_thumbnail_bytes(exif):
+    # Den inbäddade JPEG-miniatyren ligger i IFD1; offset och längd är relativa TIFF-huvudet efter "Exif\0\0".
+    if not exif or exif[:6] != b'Exif\x00\x00': return None
+    tiff = exif[6:]
+    endian = '<' if tiff[:2] == b'II' else '>'
+    try:
+        ifd0 = struct.unpack_from(endian + 'I', tiff, 4)[0]
+        count = struct.unpack_from(endian + 'H', tiff, ifd0)[0]
+        ifd1 = struct.unpack_from(endian + 'I', tiff, ifd0 + 2 + count * 12)[0]
+        if not ifd1: return None
+        tags = {}
+        for i in range(struct.unpack_from(endian + 'H', tiff, ifd1)[0]):
+            tag, _, _, value = struct.unpack_from(endian + 'HHII', tiff, ifd1 + 2 + i * 12)
+            tags[tag] = value
+    except struct.error:
+        return None
+    start, length = tags.get(0x0201), tags.get(0x0202)
+    if not start or not length: return None
+    data = tiff[start:start + length]
+    return data if data[:2] == b'\xff\xd8' and len(data) == length else None
+
+def make_photo_thumbnail(media_source, thumb_path, size=PHOTO_THUMBNAIL_SIZE):
+    with Image.open(media_source) as img:
+        if img.format == 'JPEG':
+            embedded = exif_thumbnail_bytes(img.info.get('exif'))
+            if embedded:
+                try:
+                    with Image.open(io.BytesIO(embedded)) as thumb:
+                        if thumb.width >= size[0] or thumb.height >= size[1]:
+                            thumb.thumbnail(size)
+                            thumb.convert('RGB').save(thumb_path, "JPEG")
+                            return True
+                except Exception:
+                    pass
+            # draft() låter libjpeg avkoda i 1/2-1/8 skala i stället för hela bilden.
+            img.draft('RGB', size)
+        img.thumbnail(size)
+        img.convert('RGB').save(thumb_path, "JPEG")
+    return True
+
+_photo_pool = None
+_photo_pool_lock = threading.Lock()
+
+def photo_pool():
+    global _photo_pool
+    with _photo_pool_lock:
+        if _photo_pool is None:
+            # spawn, inte fork: processen har redan Qt-, asyncio- och pooltrådar när poolen skapas.
+            _photo_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 2, mp_context=multiprocessing.get_context('spawn'))
+        return _photo_pool
+
+def shutdown_photo_pool():
+    global _photo_pool
+    with _photo_pool_lock:
+        if _photo_pool is not None:
+            _photo_pool.shutdown(wait=False, cancel_futures=True)
+            _photo_pool = None
+
+def create_photo_thumbnail(media_source, thumb_path):
+    # Avkodningen sker i egna processer så att den inte begränsas av GIL; går poolen sönder görs den på plats.
+    try:
+        future = photo_pool().submit(make_photo_thumbnail, media_source, str(thumb_path))
+    except (OSError, RuntimeError, NotImplementedError):
+        return make_photo_thumbnail(media_source, str(thumb_path))
+    try:
+        return future.result()
+    except BrokenProcessPool:
+        shutdown_photo_pool()
+        return make_photo_thumbnail(media_source, str(thumb_path))
+
+# --- URL-extrahering (yt-dlp) med cache som följer formatens giltighetstid ---
+EXPIRE_PATH_RE = re.compile(r"/expire/(\d+)")
+
+def format_url_expiry(url):
+    expire = parse_qs(urlparse(url).query).get('expire')
+    if expire and expire[0].isdigit(): return int(expire[0])
+    m = EXPIRE_PATH_RE.search(url)
+    return int(m.group(1)) if m else None
+
+def compact_url_info(data):
+    # Bara det get_info använder sparas; fragmentlistor och headers kan vara stora.
+    formats = [{k: v for k, v in f.items() if k not in ('fragments', 'http_headers')} for f in data.get('formats') or []]
+    return {'id': data.get('id'), 'title': data.get('title'), 'duration': data.get('duration'),
+            'thumbnail': data.get('thumbnail'), 'formats': formats}
+
+class UrlInfoCache:
+    # Extraherad info per URL. En post gäller tills den första format-URL:en går ut (expire=), minus en marginal.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.entries = None
+        self.dirty = False
+
+    def _ensure_loaded(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f: self.entries = json.load(f)
+            except (IOError, json.JSONDecodeError): self.entries = {}
+
+    @staticmethod
+    def expiry_for(data, now):
+        expiries = [e for e in (format_url_expiry(f.get('url') or '') for f in data.get('formats', [])) if e]
+        return min(expiries) - URL_INFO_EXPIRY_MARGIN if expiries else now + URL_INFO_DEFAULT_TTL
+
+    def get(self, url):
+        with self.lock:
+            self._ensure_loaded()
+            entry = self.entries.get(url)
+            if not entry: return None
+            if entry['expires'] <= time.time():
+                del self.entries[url]
+                self.dirty = True
+                return None
+            return entry['data']
+
+    def put(self, url, data):
+        now = time.time()
+        expires = self.expiry_for(data, now)
+        if expires <= now: return
+        with self.lock:
+            self._ensure_loaded()
+            self.entries[url] = {'expires': expires, 'data': data}
+            if len(self.entries) > URL_INFO_CACHE_MAX_ENTRIES:
+                for key in sorted(self.entries, key=lambda k: self.entries[k]['expires'])[:len(self.entries) - URL_INFO_CACHE_MAX_ENTRIES]:
+                    del self.entries[key]
+            self.dirty = True
+
+    def save(self):
+        # Samma timer som metadatacachen; överlappande sparningar körs i tur och ordning.
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty: return
+                now = time.time()
+                snapshot = {k: e for k, e in self.entries.items() if e['expires'] > now}
+                self.dirty = False
+            try:
+                write_file_atomic(self.path, json.dumps(snapshot).encode('utf-8'))
+            except Exception as e:
+                print(f"Kunde inte spara URL-cache: {e}")
+                with self.lock: self.dirty = True
+
+URL_INFO_CACHE = UrlInfoCache(URL_INFO_CACHE_FILE)
+
+_ytdlp_pool = None
+_ytdlp_pool_lock = threading.Lock()
+_ytdlp_local = threading.local()
+
+def ytdlp_pool():
+    # Trådarna lever lika länge som programmet, så varje tråds YoutubeDL-instans (och laddade extraktorer) återanvänds.
+    global _ytdlp_pool
+    with _ytdlp_pool_lock:
+        if _ytdlp_pool is None:
+            _ytdlp_pool = ThreadPoolExecutor(max_workers=YTDLP_WORKERS, thread_name_prefix='yt-dlp')
+        return _ytdlp_pool
+
+def ytdlp_instance(cookies_path=None):
+    instances = getattr(_ytdlp_local, 'instances', None)
+    if instances is None: instances = _ytdlp_local.instances = {}
+    if cookies_path not in instances:
+        options = {'quiet': True, 'no_warnings': True, 'noprogress': True, 'noplaylist': True, 'skip_download': True,
+                   'writeautomaticsub': True, 'subtitleslangs': ['sv'], 'outtmpl': f"{SUBTITLE_DIR}/%(id)s.%(ext)s"}
+        if cookies_path: options['cookiefile'] = cookies_path
+        instances[cookies_path] = yt_dlp.YoutubeDL(options)
+    return instances[cookies_path]
+
+def extract_with_api(url, cookies_path=None):
+    ydl = ytdlp_instance(cookies_path)
+    try:
+        # download=True med skip_download skriver undertexterna men hämtar inte mediet, som CLI:ts --skip-download.
+        return ydl.sanitize_info(ydl.extract_info(url, download=True)), None
+    except yt_dlp.utils.DownloadError as e:
+        return None, str(e)
+
+def extract_with_cli(url, cookies_path=None):
+    cmd = ["yt-dlp", "-j", "--no-playlist", "--write-auto-sub", "--sub-lang", "sv", "--skip-download", "--output", f"{SUBTITLE_DIR}/%(id)s.%(ext)s"]
+    if cookies_path: cmd.extend(["--cookies", cookies_path])
+    cmd.append(url)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+    out, err = proc.communicate(timeout=60)
+    if proc.returncode != 0: return None, err or out
+    return json.loads(out), None
+
+def extract_url_info(url, cookies_path=None):
+    # Returnerar (info, felmeddelande). En nyligen extraherad URL vars format-URL:er fortfarande gäller hämtas ur cachen.
+    cached = URL_INFO_CACHE.get(url)
+    if cached: return cached, None
+    if cookies_path and not Path(cookies_path).exists(): cookies_path = None
+    SUBTITLE_DIR.mkdir(exist_ok=True)
+    if yt_dlp is not None:
+        data, err = ytdlp_pool().submit(extract_with_api, url, cookies_path).result()
+    else:
+        data, err = extract_with_cli(url, cookies_path)
+    if data:
+        data = compact_url_info(data)
+        URL_INFO_CACHE.put(url, data)
+    return data, err
+
+def flat_extract_with_api(url, cookies_path=None):
+    options = {'quiet': True, 'no_warnings': True, 'skip_download': True, 'extract_flat': 'in_playlist'}
+    if cookies_path: options['cookiefile'] = cookies_path
+    try:
+        with yt_dlp.YoutubeDL(options) as ydl:
+            return ydl.sanitize_info(ydl.extract_info(url, download=False)), None
+    except yt_dlp.utils.DownloadError as e:
+        return None, str(e)
+
+def flat_extract_with_cli(url, cookies_path=None):
+    cmd = ["yt-dlp", "-J", "--flat-playlist", "--yes-playlist"]
+    if cookies_path: cmd.extend(["--cookies", cookies_path])
+    cmd.append(url)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+    out, err = proc.communicate(timeout=300)
+    if proc.returncode != 0: return None, err or out
+    return json.loads(out), None
+
+def flatten_playlist_entries(entries):
+    # Kanaler ger ibland spellistor i spellistan (flikar); de plattas ut i ordning.
+    for entry in entries or []:
+        if not entry: continue
+        if entry.get('entries') is not None:
+            yield from flatten_playlist_entries(entry['entries'])
+            continue
+        url = entry.get('url') or entry.get('webpage_url')
+        if not url: continue
+        if not urlparse(url).scheme and entry.get('ie_key') == 'Youtube': url = f"https://www.youtube.com/watch?v={url}"
+        yield {'url': url, 'title': entry.get('title'), 'duration': entry.get('duration')}
+
+def list_playlist_entries(url, cookies_path=None):
+    # Snabb (platt) uppräkning av en spellista eller kanal utan att varje post extraheras.
+    if cookies_path and not Path(cookies_path).exists(): cookies_path = None
+    if yt_dlp is not None:
+        data, err = ytdlp_pool().submit(flat_extract_with_api, url, cookies_path).result()
+    else:
+        data, err = flat_extract_with_cli(url, cookies_path)
+    if data is None: return None, err
+    return {'title': data.get('title'), 'entries': list(flatten_playlist_entries(data.get('entries') or [data]))}, None
+
+def format_height(fmt):
+    return next((s.get('height') or 0 for s in fmt.get('streams', []) if s.get('codec_type') == 'video'), 0)
+
+def choose_format(formats, preference):
+    # Ersätter formatdialogen vid massimport: högsta upplösning inom gränsen, annars den lägsta som finns.
+    if preference == 'audio':
+        audio = [f for f in formats if f['media_type'] == 'audio']
+        if audio: return audio[-1]
+    video = [f for f in formats if f['media_type'] == 'video']
+    if not video: return formats[-1] if formats else None
+    limit = int(preference) if preference.isdigit() else None
+    fitting = [f for f in video if limit is None or format_height(f) <= limit]
+    if not fitting: return min(video, key=format_height)
+    return max(reversed(fitting), key=format_height)
+
+def pending_web_info(entry, preference):
+    return {
+        'src': entry['url'], 'type': 'web', 'original_url': entry['url'], 'title': entry.get('title') or entry['url'],
+        'length': entry.get('duration') or 0, 'is_error': False, 'length_str': "hämtas...", 'thumbnail_path': None,
+        'streams': [], 'media_type': 'audio' if preference == 'audio' else 'video', 'rotation': 0,
+        'format_pref': preference, 'pending': True
+    }
+
+def warm_ytdlp():
+    if yt_dlp is not None: ytdlp_pool().submit(ytdlp_instance)
+
+def get_info(media_source, is_url, cookies_path=None, cancel=None):
     info = {'is_error': True, 'error_message': 'Okänt fel'}
     try:
         if is_url:
-            SUBTITLE_DIR.mkdir(exist_ok=True)
-            cmd = ["yt-dlp", "-j", "--no-playlist", "--write-auto-sub", "--sub-lang", "sv", "--skip-download", "--output", f"{SUBTITLE_DIR}/%(id)s.%(ext)s"]
-            if cookies_path and Path(cookies_path).exists():
-                cmd.extend(["--cookies", cookies_path])
-            cmd.append(media_source)
-            
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-            out, err = proc.communicate(timeout=60)
-            if proc.returncode != 0:
-                info['error_message'] = f"yt-dlp misslyckades:\n{err or out}"
+            data, err = extract_url_info(media_source, cookies_path)
+            if data is None:
+                info['error_message'] = f"yt-dlp misslyckades:\n{err}"
                 return info
-            data = json.loads(out)
             sub_path = SUBTITLE_DIR / f"{data.get('id')}.sv.vtt"
             info = {
                 'title': data.get('title', 'Okänd Titel'), 'length': data.get('duration', 0), 'is_error': False,
-                'length_str': time.strftime('%H:%M:%S', time.gmtime(data.get('duration', 0))) if data.get('duration', 0) >= 3600 else time.strftime('%M:%S', time.gmtime(data.get('duration', 0))),
+                'length_str': format_length(data.get('duration', 0)),
                 'id': data.get('id'),
                 'thumbnail_path': get_thumbnail_path(data.get('id'), data.get('thumbnail')),
                 'subtitle_path': str(sub_path) if sub_path.exists() else None,
@@ -252,59 +1826,1072 @@ def get_info(media_source, is_url, cookies_path=None):
             for f in data.get('formats', []):
                 if f.get('vcodec') != 'none' and f.get('acodec') != 'none':
                     label = f.get('format_note', f.get('resolution', 'N/A'))
-                    info['formats'].append({'label': label, 'url': f['url'], 'media_type': 'video'})
+                    info['formats'].append({'label': label, 'url': f['url'], 'media_type': 'video', 'streams': streams_from_format(f), 'format_id': f.get('format_id'), 'protocol': f.get('protocol')})
             for f in data.get('formats', []):
                 if f.get('vcodec') == 'none' and f.get('acodec') != 'none': 
                     label = f"Endast ljud ({f.get('acodec')})"
-                    info['formats'].append({'label': label, 'url': f['url'], 'media_type': 'audio'})
+                    info['formats'].append({'label': label, 'url': f['url'], 'media_type': 'audio', 'streams': streams_from_format(f), 'format_id': f.get('format_id'), 'protocol': f.get('protocol')})
         else:
+            cached = METADATA_CACHE.get(media_source)
+            if cached:
+                if cached.get('thumbnail_path'): THUMBNAILS.touch(cached['thumbnail_path'])
+                return build_local_info(media_source, cached)
+
             p_media_source = Path(media_source)
-            media_id = hex(hash(media_source) & 0xffffffff)[2:]
-            thumb_path = THUMBNAIL_DIR / f"{media_id}.jpg"
+            media_id = local_media_id(media_source)
+            thumb_path = THUMBNAILS.lookup(f"{media_id}.jpg") or THUMBNAILS.path_for(f"{media_id}.jpg")
 
             if p_media_source.suffix.lower() in VALID_IMAGE_EXT:
                 if not thumb_path.exists():
                     try:
-                        img = Image.open(media_source)
-                        img.thumbnail((128, 128))
-                        img.convert('RGB').save(thumb_path, "JPEG")
+                        create_photo_thumbnail(media_source, thumb_path)
+                        THUMBNAILS.added(thumb_path)
                     except Exception as e:
                         print(f"Kunde inte skapa miniatyrbild för {p_media_source.name}: {e}")
                         thumb_path = None
                 
-                info = {
-                    'src': media_source, 'type': 'local', 'title': p_media_source.name, 
-                    'length': 0, 'is_error': False, 'length_str': "Bild", 
-                    'thumbnail_path': str(thumb_path) if thumb_path else None,
-                    'media_type': 'image'
-                }
-                return info
-            
-            if not thumb_path.exists():
-                subprocess.run(["ffmpeg", "-i", media_source, "-ss", "00:00:05", "-vframes", "1", str(thumb_path)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-
-            cmd = ["ffprobe", "-v", "quiet", "-print_format", "json", "-show_format", "-show_streams", media_source]
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-            out, _ = proc.communicate(timeout=15)
-            data = json.loads(out)
-            duration = float(data.get('format', {}).get('duration', 0))
-            streams = data.get('streams', [])
-            video_stream = next((s for s in streams if s.get('codec_type') == 'video'), None)
-            audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+                meta = {'length': 0, 'streams': [], 'media_type': 'image', 'audio_codec': None,
+                        'thumbnail_path': str(thumb_path) if thumb_path else None}
+                METADATA_CACHE.put(media_source, meta)
+                return build_local_info(media_source, meta)
             
-            length_str_format = '%H:%M:%S' if duration >= 3600 else '%M:%S'
-
-            info = {
-                'src': media_source, 'type': 'local', 'title': Path(media_source).name, 'length': duration, 'is_error': False,
-                'length_str': time.strftime(length_str_format, time.gmtime(duration)), 
+            header_meta = read_media_headers(media_source)
+            if thumb_path.exists() or p_media_source.suffix.lower() in AUDIO_ONLY_EXT:
+                meta = header_meta or ffprobe_media(media_source, cancel=cancel)
+            else:
+                # Miniatyrbilden kräver ändå ffmpeg, men med känd längd träffar första försöket rätt position.
+                meta = probe_with_thumbnail(media_source, thumb_path, header_meta['length'] if header_meta else None, cancel=cancel)
+            video_stream = next((s for s in meta['streams'] if s.get('codec_type') == 'video'), None)
+            audio_stream = next((s for s in meta['streams'] if s.get('codec_type') == 'audio'), None)
+            meta.update({
                 'thumbnail_path': str(thumb_path) if thumb_path.exists() else None,
                 'media_type': 'audio' if not video_stream and audio_stream else 'video',
                 'audio_codec': audio_stream.get('codec_name') if audio_stream else None
-            }
+            })
+            METADATA_CACHE.put(media_source, meta)
+            info = build_local_info(media_source, meta)
+    except ProbeCancelled:
+        info['error_message'] = "Avbruten"
     except Exception:
         info['error_message'] = f"Fel vid info-hämtning: {traceback.format_exc()}"
     return info
 
+def pending_local_info(media_source):
+    # Platshållare som visas direkt i spellistan medan filen väntar på att analyseras.
+    ext = Path(media_source).suffix.lower()
+    media_type = 'image' if ext in VALID_IMAGE_EXT else 'audio' if ext in AUDIO_ONLY_EXT else 'video'
+    return {
+        'src': media_source, 'type': 'local', 'title': Path(media_source).name,
+        'length': 0, 'is_error': False, 'length_str': "analyseras...", 'thumbnail_path': None,
+        'streams': [], 'media_type': media_type, 'audio_codec': None, 'rotation': 0, 'pending': True
+    }
+
+# --- Transkodningsplanering ---
+# Chromecast spelar H.264 (8 bit 4:2:0, upp till 1080p) med AAC direkt; allt annat måste kodas om.
+CAST_H264_PIX_FMTS = ('yuv420p', 'yuvj420p')
+CAST_H264_UNSUPPORTED_PROFILES = ('High 10', 'High 4:2:2', 'High 4:4:4 Predictive', 'High 10 Intra', 'High 4:4:4 Intra')
+CAST_MAX_WIDTH, CAST_MAX_HEIGHT = 1920, 1080
+CAST_DIRECT_AUDIO_CODECS = ('aac', 'mp3', 'flac', 'opus', 'vorbis')
+CAST_DIRECT_AUDIO_TYPES = {'.mp3': 'audio/mpeg', '.flac': 'audio/flac', '.m4a': 'audio/mp4'}
+AVC_PROFILES = {'42': 'Baseline', '4d': 'Main', '58': 'Extended', '64': 'High', '6e': 'High 10', '7a': 'High 4:2:2', 'f4': 'High 4:4:4 Predictive'}
+
+def streams_from_format(fmt):
+    # Bygger en stream-sammanfattning (som från ffprobe) ur yt-dlp:s codec-strängar, t.ex. "avc1.64001F" / "mp4a.40.2".
+    streams = []
+    vcodec, acodec = fmt.get('vcodec') or 'none', fmt.get('acodec') or 'none'
+    if vcodec != 'none':
+        stream = {'codec_type': 'video', 'codec_name': vcodec.split('.')[0]}
+        if vcodec.startswith(('avc1', 'avc3')):
+            stream['codec_name'] = 'h264'
+            profile = AVC_PROFILES.get(vcodec[5:7].lower()) if len(vcodec) >= 7 else None
+            if profile: stream['profile'] = profile
+        if fmt.get('width'): stream['width'] = fmt['width']
+        if fmt.get('height'): stream['height'] = fmt['height']
+        streams.append(stream)
+    if acodec != 'none':
+        codec = acodec.split('.')[0]
+        streams.append({'codec_type': 'audio', 'codec_name': 'aac' if codec == 'mp4a' else codec})
+    return streams
+
+def build_video_filters(media_data):
+    vf = []
+    rotation = media_data.get('rotation', 0)
+    if media_data.get('media_type') != 'audio' and rotation != 0:
+        if rotation == 90:
+            vf.append("transpose=1")
+        elif rotation == 180:
+            vf.append("transpose=2,transpose=2")
+        elif rotation == 270:
+            vf.append("transpose=2")
+
+    if media_data.get('subtitle_path'):
+        subtitle_path = media_data['subtitle_path'].replace('\\', '/')
+        if sys.platform == "win32":
+             subtitle_path = re.sub(r'([A-Za-z]):\\', r'/mnt/\1/', subtitle_path).replace('\\', '/')
+        subtitle_path = subtitle_path.replace(':', '\\:')
+        vf.append(f"subtitles='{subtitle_path}'")
+    return vf
+
+def build_audio_filters(settings):
+    gains = [settings.get(f'eq_{b}', 0) for b in ['bas', 'mellan', 'diskant']]
+    if not any(g != 0 for g in gains): return []
+    eq_bands = [f"equalizer=f={f}:width_type=h:width={w}:g={g}"
+                for (f, w), g in zip([(64, 50), (1000, 200), (10000, 2000)], gains)]
+    return [','.join(eq_bands)]
+
+def video_is_cast_compatible(stream):
+    return (stream.get('codec_name') == 'h264'
+            and stream.get('pix_fmt', 'yuv420p') in CAST_H264_PIX_FMTS
+            and stream.get('profile') not in CAST_H264_UNSUPPORTED_PROFILES
+            and stream.get('width', 0) <= CAST_MAX_WIDTH and stream.get('height', 0) <= CAST_MAX_HEIGHT)
+
+def plan_transcode(media_data, settings, start_time=0):
+    # Väljer per ström: spela filen direkt, byt bara container (-c copy) eller koda om endast det som krävs.
+    # Direktuppspelade filer serveras med Range-stöd, så mottagaren söker själv och start_time spelar ingen roll.
+    streams = media_data.get('streams') or []
+    video = next((s for s in streams if s.get('codec_type') == 'video'), None)
+    audio = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+    is_audio = media_data.get('media_type') == 'audio'
+    is_local = media_data.get('type') == 'local'
+    vf = [] if is_audio else build_video_filters(media_data)
+    af = build_audio_filters(settings)
+    from_start = start_time <= 0.5
+    ext = Path(media_data['src']).suffix.lower() if is_local else ''
+
+    audio_copy = audio is not None and not af and audio.get('codec_name') == 'aac' and audio.get('channels', 2) <= 2
+    if is_audio:
+        direct = (is_local and not af and ext in CAST_DIRECT_AUDIO_TYPES and audio is not None
+                  and audio.get('codec_name') in CAST_DIRECT_AUDIO_CODECS)
+        if direct:
+            return {'mode': 'direct', 'path': media_data['src'], 'content_type': CAST_DIRECT_AUDIO_TYPES[ext]}
+        video_copy = False
+    else:
+        video_copy = video is not None and not vf and video_is_cast_compatible(video)
+        container = media_data.get('container') or ''
+        if (is_local and video_copy and (audio is None or audio_copy)
+                and ext in ('.mp4', '.mov', '.m4v') and ('mp4' in container or 'mov' in container)):
+            return {'mode': 'direct', 'path': media_data['src'], 'content_type': 'video/mp4'}
+
+    codec_args = []
+    if is_audio:
+        codec_args.extend(["-map", "0:a:0"])
+        if af: codec_args.extend(["-af", ",".join(af)])
+        codec_args.extend(["-c:a", "copy"] if audio_copy else ["-c:a", "aac", "-ac", "2"])
+    else:
+        codec_args.extend(["-map", "0:V:0?", "-map", "0:a:0?", "-sn", "-dn"])
+        if vf: codec_args.extend(["-vf", ",".join(vf)])
+        if af: codec_args.extend(["-af", ",".join(af)])
+        codec_args.extend(["-c:v", "copy"] if video_copy else ["-c:v", "libx264", "-preset", "veryfast"])
+        codec_args.extend(["-c:a", "copy"] if audio_copy else ["-c:a", "aac", "-ac", "2"])
+
+    plan = {'src': media_data['src'], 'codec_args': codec_args, 'video_copy': video_copy, 'audio_copy': audio_copy}
+    if not is_audio and not video_copy and settings.get('hls_enabled', True) and media_data.get('length', 0) > 0:
+        # Omkodad video går som HLS: segmenten kodas på begäran, så en sökning blir bara en segmenthämtning.
+        audio_args = (["-af", ",".join(af)] if af else []) + (["-c:a", "copy"] if audio_copy else ["-c:a", "aac", "-ac", "2"])
+        renditions = hls_renditions(video, media_data.get('rotation', 0), settings.get('abr_enabled', True))
+        plan.update({'mode': 'hls', 'content_type': 'application/x-mpegURL', 'duration': media_data['length'],
+                     'video_filters': vf, 'audio_args': audio_args, 'renditions': renditions,
+                     'cache_key': transcode_cache_key(media_data, 'hls', [vf, audio_args, renditions])})
+        return plan
+
+    cache_key = transcode_cache_key(media_data, 'audio' if is_audio else 'video', codec_args)
+    cache_name = f"{cache_key}.{'m4a' if is_audio else 'mp4'}" if cache_key else None
+    cached = TRANSCODE_CACHE.lookup(cache_name) if cache_name else None
+    if cached:
+        return {'mode': 'direct', 'path': str(cached), 'content_type': 'audio/mp4' if is_audio else 'video/mp4', 'cached': True}
+
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if not from_start:
+        args.extend(["-ss", str(start_time)])
+    args.extend(["-i", media_data['src']])
+    args.extend(codec_args)
+    if not is_audio and not video_copy: args.extend(["-tune", "zerolatency"])
+    stream_format = "adts" if is_audio else "mp4"
+    stream_options = [] if is_audio else ["-movflags", "frag_keyframe+empty_moov"]
+    content_type = 'audio/aac' if is_audio else 'video/mp4'
+    plain_args = args + ["-f", stream_format] + stream_options + ["pipe:1"]
+    if cache_name and from_start:
+        # En hel kodning från början skrivs samtidigt till cachen (som vanlig faststart-mp4) via tee-muxern.
+        cache_path = TRANSCODE_CACHE.path_for(cache_name)
+        part_path = cache_path.with_name(cache_path.name + ".part")
+        stream_slave = "[f=adts]pipe:1" if is_audio else "[f=mp4:movflags=frag_keyframe+empty_moov]pipe:1"
+        cache_slave = "[f=mp4:movflags=+faststart]" + tee_quote(part_path)
+        # tee skickar inte vidare globala huvuden; utan dem får mp4-utdatan från libx264/aac en tom avcC/esds.
+        args.extend(["-flags:v", "+global_header", "-flags:a", "+global_header", "-f", "tee", f"{stream_slave}|{cache_slave}"])
+        plan.update({'cache_path': str(cache_path), 'cache_part': str(part_path)})
+    else:
+        args = plain_args
+    plan.update({'mode': 'remux' if audio_copy and (is_audio or video_copy) else 'transcode',
+                 'args': args, 'plain_args': plain_args, 'content_type': content_type})
+    return plan
+
+def hls_renditions(video, rotation, abr_enabled):
+    # Varianter för adaptiv bithastighet; aldrig högre upplösning än källan (efter rotation).
+    width, height = (video or {}).get('width'), (video or {}).get('height')
+    if width and height and rotation in (90, 270): width, height = height, width
+    aspect = width / height if width and height else 16 / 9
+    if not abr_enabled or not height:
+        return [{'height': None, 'width': width, 'kbps': None}]
+    ladder = [(h, kbps) for h, kbps in ABR_LADDER if h <= height] or [(height, ABR_LADDER[-1][1])]
+    return [{'height': h, 'width': int(round(h * aspect / 2)) * 2, 'kbps': kbps} for h, kbps in ladder]
+
+def tee_quote(path):
+    return "'" + Path(path).as_posix().replace("'", "'\\''") + "'"
+
+def transcode_cache_key(media_data, kind, codec_args):
+    # Källans fingeravtryck plus exakt de ffmpeg-argument som styr resultatet.
+    if media_data.get('type') == 'local':
+        try: fingerprint = list(MetadataCache.file_key(media_data['src']))
+        except OSError: return None
+    elif media_data.get('original_url') and media_data.get('format_id'):
+        fingerprint = [media_data['original_url'], media_data['format_id']]
+    else:
+        return None
+    key_data = json.dumps([fingerprint, kind, codec_args, HLS_SEGMENT_SECONDS if kind == 'hls' else None])
+    return hashlib.sha1(key_data.encode('utf-8')).hexdigest()
+
+# --- HTTP för mediaservern ---
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)$")
+# Cast-mottagaren hämtar HLS (spellistor och segment) med XHR och kräver då CORS.
+CORS_HEADERS = {'Access-Control-Allow-Origin': '*', 'Access-Control-Expose-Headers': 'Content-Length, Content-Range, Accept-Ranges'}
+
+def parse_range_header(header, size):
+    # Returnerar (start, slut) inklusive, None utan giltig Range, eller 'invalid' (416) utanför filen.
+    if not header: return None
+    m = RANGE_RE.match(header.strip())
+    if not m or not (m.group(1) or m.group(2)): return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        start, end = max(0, size - int(m.group(2))), size - 1
+    if start >= size or start > end: return 'invalid'
+    return start, end
+
+class HttpRequest:
+    def __init__(self, method, target, version, headers):
+        self.method, self.target, self.version, self.headers = method, target, version, headers
+
+    @property
+    def head_only(self):
+        return self.method == 'HEAD'
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get('connection', '').lower()
+        return connection != 'close' if self.version == 'HTTP/1.1' else connection == 'keep-alive'
+
+async def read_http_request(reader, idle_timeout):
+    try:
+        line = await asyncio.wait_for(reader.readline(), idle_timeout)
+    except asyncio.TimeoutError:
+        return None
+    parts = line.decode('latin-1').split()
+    if len(parts) != 3: return None
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''): break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    return HttpRequest(parts[0], parts[1], parts[2], headers)
+
+def write_response_head(writer, status, headers, keep_alive):
+    # CORS på alla svar: mastern, variantspellistorna och segmenten i en ABR-stege hämtas alla med XHR.
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in dict(CORS_HEADERS, **headers).items())
+    lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+
+async def send_bytes(request, writer, status, content_type, body):
+    keep_alive = request.keep_alive
+    write_response_head(writer, status, {'Content-Type': content_type, 'Content-Length': len(body)}, keep_alive)
+    if not request.head_only: writer.write(body)
+    await writer.drain()
+    return keep_alive
+
+async def send_error(request, writer, status):
+    return await send_bytes(request, writer, status, 'text/plain; charset=utf-8', HTTPStatus(status).phrase.encode('utf-8'))
+
+async def send_file(request, writer, filepath, content_type):
+    # Range/206, HEAD och nollkopiering via loop.sendfile (os.sendfile/TransmitFile när transporten stöder det).
+    try:
+        f = open(filepath, 'rb')
+    except OSError:
+        return await send_error(request, writer, 404)
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        byte_range = parse_range_header(request.headers.get('range'), size)
+        keep_alive = request.keep_alive
+        if byte_range == 'invalid':
+            write_response_head(writer, 416, {'Content-Range': f"bytes */{size}", 'Content-Length': 0}, keep_alive)
+            await writer.drain()
+            return keep_alive
+        start, end = byte_range or (0, size - 1)
+        length = max(0, end - start + 1)
+        headers = {'Content-Type': content_type, 'Accept-Ranges': 'bytes', 'Content-Length': length}
+        if byte_range: headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        write_response_head(writer, 206 if byte_range else 200, headers, keep_alive)
+        await writer.drain()
+        if not request.head_only and length:
+            await asyncio.get_running_loop().sendfile(writer.transport, f, start, length)
+    return keep_alive
+
+# --- HLS-segmentering på begäran ---
+class HlsSession:
+    # Spellistorna byggs ur den probade längden; segmenten kodas först när de efterfrågas.
+    # En ffmpeg-process avkodar källan en gång och kodar alla aktiva varianter framåt från det segment
+    # mottagaren bad om. Ber mottagaren om ett segment långt från kodarens position (t.ex. efter en
+    # sökning), eller om en variant som inte kodas just nu, startas kodaren om där.
+    RESTART_DISTANCE = 3
+    SEGMENT_WAIT_TIMEOUT = 60
+    THROUGHPUT_MIN_BYTES = 256 * 1024
+    THROUGHPUT_HEADROOM = 1.5
+
+    def __init__(self, plan, work_dir, persistent=False):
+        self.src = plan['src']
+        self.video_filters = plan['video_filters']
+        self.audio_args = plan['audio_args']
+        self.renditions = plan['renditions']
+        self.duration = plan['duration']
+        self.segment_count = max(1, math.ceil(self.duration / HLS_SEGMENT_SECONDS))
+        self.work_dir = Path(work_dir)
+        self.persistent = persistent
+        self.cond = threading.Condition()
+        self.ready = []
+        for i in range(len(self.renditions)):
+            self.rendition_dir(i).mkdir(parents=True, exist_ok=True)
+            # Segment som blev klara i en tidigare session (transkodningscachen) används direkt.
+            try:
+                with open(self.rendition_dir(i) / "ready.txt", 'r', encoding='utf-8') as f:
+                    listed = {int(line) for line in f if line.strip().isdigit()}
+                self.ready.append({n for n in listed if (self.rendition_dir(i) / self.segment_name(n)).exists()})
+            except OSError:
+                self.ready.append(set())
+        self.proc, self.proc_start, self.proc_started_at = None, None, None
+        self.active = set(range(len(self.renditions)))
+        self.preset = 'veryfast'
+        self.throughput = None  # bit/s, glidande medelvärde av uppmätt sändhastighet
+        self.closed = False
+        self.in_use = False
+
+    def rendition_dir(self, i):
+        return self.work_dir / f"r{i}"
+
+    def staging_dir(self, i):
+        # Kodaren skriver hit; ett segment flyttas till sitt slutliga namn först när det är färdigskrivet.
+        return self.rendition_dir(i) / "enc"
+
+    def segment_name(self, n):
+        return f"seg_{n:05d}.ts"
+
+    def segment_duration(self, n):
+        return min(HLS_SEGMENT_SECONDS, self.duration - n * HLS_SEGMENT_SECONDS)
+
+    def rendition_bandwidth(self, r):
+        return ((r['kbps'] or 8000) + HLS_AUDIO_KBPS) * 1000
+
+    def master_playlist(self):
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3"]
+        for i, r in enumerate(self.renditions):
+            attrs = f"BANDWIDTH={self.rendition_bandwidth(r)}"
+            if r['height'] and r['width']: attrs += f",RESOLUTION={r['width']}x{r['height']}"
+            lines.append(f"#EXT-X-STREAM-INF:{attrs}")
+            lines.append(f"r{i}/index.m3u8")
+        return "\n".join(lines) + "\n"
+
+    def media_playlist(self):
+        # Kodaren tvingas till nyckelbilder på segmentgränserna, men ett segment slutar först på första bilden efter
+        # gränsen och kan därför bli en bildruta längre. En sekunds marginal håller varje avrundad EXTINF inom målet.
+        target = math.ceil(max(self.segment_duration(n) for n in range(self.segment_count))) + 1
+        lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target}",
+                 "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+        for n in range(self.segment_count):
+            lines.append(f"#EXTINF:{self.segment_duration(n):.3f},")
+            lines.append(self.segment_name(n))
+        lines.append("#EXT-X-ENDLIST")
+        return "\n".join(lines) + "\n"
+
+    def record_throughput(self, nbytes, seconds):
+        if nbytes < self.THROUGHPUT_MIN_BYTES or seconds <= 0: return
+        bps = nbytes * 8 / seconds
+        with self.cond:
+            self.throughput = bps if self.throughput is None else 0.7 * self.throughput + 0.3 * bps
+
+    def _refresh_ready(self):
+        # Segmentlistan får en rad först när segmentet stängts. Ett segment som redan finns skrivs aldrig över;
+        # kodarens kopia (efter en omstart bakåt eller byte av variant) kastas i stället.
+        for i in self.active:
+            staging = self.staging_dir(i)
+            found = set()
+            try:
+                with open(staging / "segments.csv", 'r', encoding='utf-8') as f:
+                    for line in f:
+                        m = re.match(r"seg_(\d+)\.ts,", line)
+                        if m: found.add(int(m.group(1)))
+            except OSError: continue
+            new = set()
+            for n in found:
+                staged = staging / self.segment_name(n)
+                if not staged.exists(): continue
+                try:
+                    if n in self.ready[i]: staged.unlink()
+                    else:
+                        os.replace(staged, self.rendition_dir(i) / self.segment_name(n))
+                        new.add(n)
+                except OSError: pass
+            if not new: continue
+            self.ready[i] |= new
+            try:
+                with open(self.rendition_dir(i) / "ready.txt", 'a', encoding='utf-8') as f:
+                    f.writelines(f"{n}\n" for n in sorted(new))
+            except OSError: pass
+        self._update_encoder_speed()
+
+    def _encoder_position(self, i):
+        n = self.proc_start
+        while n in self.ready[i]: n += 1
+        return n
+
+    def _update_encoder_speed(self):
+        # Kodar vi inte snabbare än realtid används en snabbare preset vid nästa omstart.
+        if self.proc is None or not self.active: return
+        produced = (min(self._encoder_position(i) for i in self.active) - self.proc_start) * HLS_SEGMENT_SECONDS
+        elapsed = time.monotonic() - self.proc_started_at
+        if produced < 2 * HLS_SEGMENT_SECONDS or elapsed <= 0: return
+        speed = produced / elapsed
+        if speed < 1.2: self.preset = 'ultrafast'
+        elif speed > 3: self.preset = 'veryfast'
+
+    def _choose_renditions(self, wanted):
+        # Varianter som den uppmätta bandbredden inte räcker till kodas inte; den lägsta och den efterfrågade alltid.
+        lowest = len(self.renditions) - 1
+        chosen = {lowest, wanted}
+        for i, r in enumerate(self.renditions):
+            if self.throughput is None or self.rendition_bandwidth(r) * self.THROUGHPUT_HEADROOM <= self.throughput:
+                chosen.add(i)
+        return chosen
+
+    def _start_encoder(self, n, wanted):
+        self._stop_encoder()
+        self._refresh_ready()
+        self.active = self._choose_renditions(wanted)
+        start = n * HLS_SEGMENT_SECONDS
+        # Segmentgränser ges som absoluta tider eftersom -output_ts_offset håller tidsstämplarna kontinuerliga mellan omstarter.
+        cut_times = ",".join(str(k * HLS_SEGMENT_SECONDS) for k in range(n + 1, self.segment_count))
+        outputs = sorted(self.active)
+        chain = ",".join(self.video_filters) + "," if self.video_filters else ""
+        graph = [f"[0:V:0]{chain}split={len(outputs)}" + "".join(f"[s{k}]" for k in range(len(outputs)))]
+        for k, i in enumerate(outputs):
+            height = self.renditions[i]['height']
+            graph.append(f"[s{k}]scale=-2:{height}[v{k}]" if height else f"[s{k}]null[v{k}]")
+        args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-ss", str(start), "-i", self.src,
+                "-filter_complex", ";".join(graph)]
+        for k, i in enumerate(outputs):
+            r, out_dir = self.renditions[i], self.staging_dir(i)
+            # Ofullständiga segment från en avbruten kodare kastas.
+            shutil.rmtree(out_dir, ignore_errors=True)
+            out_dir.mkdir(parents=True, exist_ok=True)
+            args.extend(["-map", f"[v{k}]", "-map", "0:a:0?", "-sn", "-dn", "-c:v", "libx264", "-preset", self.preset])
+            if r['kbps']:
+                args.extend(["-b:v", f"{r['kbps']}k", "-maxrate", f"{int(r['kbps'] * 1.2)}k", "-bufsize", f"{r['kbps'] * 2}k"])
+            args.extend(self.audio_args)
+            args.extend(["-force_key_frames", f"expr:gte(t,n_forced*{HLS_SEGMENT_SECONDS})",
+                         "-f", "segment", "-segment_format", "mpegts", "-segment_time_delta", "0.05",
+                         "-segment_start_number", str(n), "-segment_list", str(out_dir / "segments.csv"),
+                         "-segment_list_type", "csv", "-output_ts_offset", str(start)])
+            if cut_times: args.extend(["-segment_times", cut_times])
+            args.append(str(out_dir / "seg_%05d.ts"))
+        self.proc = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+        self.proc_start, self.proc_started_at = n, time.monotonic()
+
+    def _stop_encoder(self):
+        if self.proc and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+    def get_segment(self, i, n):
+        if not (0 <= i < len(self.renditions) and 0 <= n < self.segment_count): return None
+        deadline = time.monotonic() + self.SEGMENT_WAIT_TIMEOUT
+        with self.cond:
+            while not self.closed:
+                self._refresh_ready()
+                if n in self.ready[i]: return self.rendition_dir(i) / self.segment_name(n)
+                running = self.proc is not None and self.proc.poll() is None
+                if (not running or i not in self.active or n < self.proc_start
+                        or n > self._encoder_position(i) + self.RESTART_DISTANCE):
+                    self._start_encoder(n, i)
+                if time.monotonic() > deadline: return None
+                self.cond.wait(0.1)
+        return None
+
+    async def handle(self, request, writer, resource):
+        if resource.endswith('.m3u8'):
+            playlist = self.master_playlist() if resource == 'stream.m3u8' else self.media_playlist()
+            return await send_bytes(request, writer, 200, 'application/x-mpegURL', playlist.encode('utf-8'))
+        m = re.match(r"r(\d+)/seg_(\d+)\.ts$", resource)
+        if not m: return await send_error(request, writer, 404)
+        # Väntan på kodaren sker i en arbetstråd så att händelseloopen aldrig blockeras.
+        loop = asyncio.get_running_loop()
+        segment = await loop.run_in_executor(None, self.get_segment, int(m.group(1)), int(m.group(2)))
+        if not segment: return await send_error(request, writer, 404)
+        started = loop.time()
+        keep_alive = await send_file(request, writer, segment, 'video/MP2T')
+        if not request.head_only:
+            self.record_throughput(os.path.getsize(segment), loop.time() - started)
+        return keep_alive
+
+    def prefetch(self, count):
+        # Förbereder de första segmenten medan föregående objekt spelas; kodaren stoppas sedan tills mottagaren frågar.
+        for n in range(min(count, self.segment_count)):
+            if self.closed or self.in_use or not self.get_segment(0, n): break
+        with self.cond:
+            if not self.in_use: self._stop_encoder()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self._stop_encoder()
+            self._refresh_ready()
+            self.cond.notify_all()
+        if self.persistent:
+            # Bara färdiga segment stannar i cachen; det kodaren höll på med när den avbröts kastas.
+            for i in range(len(self.renditions)): shutil.rmtree(self.staging_dir(i), ignore_errors=True)
+            TRANSCODE_CACHE.added(self.work_dir)
+        else:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+# --- Mediaserver (asyncio) ---
+class FileSession:
+    def __init__(self, path, content_type):
+        self.path, self.content_type = path, content_type
+
+    async def handle(self, request, writer, resource):
+        return await send_file(request, writer, self.path, self.content_type)
+
+    def close(self): pass
+
+# --- Bildleverans: nedskalning till mottagarens upplösning ---
+def receiver_resolution(cast):
+    # Chromecast rapporterar ingen skärmupplösning; modellnamnet räcker för att skilja ut 4K-mottagarna.
+    cast_info = getattr(cast, 'cast_info', None)
+    model = getattr(cast_info, 'model_name', None) or getattr(cast, 'model_name', None) or ''
+    return RECEIVER_RESOLUTION_UHD if any(k in model for k in ('Ultra', 'Google TV', '4K')) else RECEIVER_RESOLUTION_HD
+
+def render_image(filepath, rotation, max_size):
+    # Returnerar (bytes, content_type), eller None om originalfilen kan skickas som den är.
+    with Image.open(filepath) as img:
+        fits = img.width <= max_size[0] and img.height <= max_size[1]
+        if rotation == 0 and (fits or getattr(img, 'is_animated', False)) and img.format in ('JPEG', 'PNG', 'GIF', 'WEBP'):
+            return None
+        fit = max_size if rotation % 180 == 0 else (max_size[1], max_size[0])
+        if img.format == 'JPEG': img.draft('RGB', fit)
+        img.thumbnail(fit)
+        if rotation: img = img.rotate(-rotation, expand=True)
+        has_alpha = img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+        buffer = io.BytesIO()
+        if has_alpha:
+            img.save(buffer, format='PNG')
+            return buffer.getvalue(), 'image/png'
+        img.convert('RGB').save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue(), 'image/jpeg'
+
+class ImageDeliveryCache:
+    # Färdigskalade bilder: en liten LRU i minnet framför en DiskLruStore, nycklad på fil, rotation och upplösning.
+    FORMATS = (('.jpg', 'image/jpeg'), ('.png', 'image/png'))
+
+    def __init__(self, store, memory_bytes):
+        self.store = store
+        self.memory_bytes = memory_bytes
+        self.memory = OrderedDict()
+        self.memory_total = 0
+        self.lock = threading.Lock()
+
+    def _remember(self, name, entry):
+        with self.lock:
+            if name in self.memory: return
+            self.memory[name] = entry
+            self.memory_total += len(entry[0]) if entry else 0
+            while self.memory_total > self.memory_bytes and len(self.memory) > 1:
+                _, old = self.memory.popitem(last=False)
+                self.memory_total -= len(old[0]) if old else 0
+
+    def get(self, filepath, rotation, max_size):
+        name = f"{local_media_id(filepath)}_{rotation}_{max_size[0]}x{max_size[1]}"
+        with self.lock:
+            if name in self.memory:
+                self.memory.move_to_end(name)
+                return self.memory[name]
+        for ext, content_type in self.FORMATS:
+            path = self.store.lookup(name + ext)
+            if path:
+                entry = (path.read_bytes(), content_type)
+                self._remember(name, entry)
+                return entry
+        entry = render_image(filepath, rotation, max_size)
+        if entry:
+            body, content_type = entry
+            path = self.store.path_for(name + dict((c, e) for e, c in self.FORMATS)[content_type])
+            write_file_atomic(path, body)
+            self.store.added(path)
+        self._remember(name, entry)
+        return entry
+
+    def prefetch(self, filepath, rotation, max_size):
+        # Fel här visas först när bilden faktiskt ska spelas upp.
+        try: self.get(filepath, rotation, max_size)
+        except Exception as e: print(f"Kunde inte förbereda bild {filepath}: {e}")
+
+IMAGE_CACHE = ImageDeliveryCache(DiskLruStore(IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_BYTES), IMAGE_MEMORY_CACHE_BYTES)
+
+class ImageSession:
+    def __init__(self, media_data, max_size=RECEIVER_RESOLUTION_HD):
+        self.filepath = media_data['src']
+        self.rotation = media_data.get('rotation', 0)
+        self.max_size = max_size
+
+    async def handle(self, request, writer, resource):
+        try:
+            entry = await asyncio.get_running_loop().run_in_executor(None, IMAGE_CACHE.get, self.filepath, self.rotation, self.max_size)
+        except FileNotFoundError:
+            return await send_error(request, writer, 404)
+        except Exception as e:
+            print(f"Fel vid servering av bild: {e}")
+            traceback.print_exc()
+            return await send_error(request, writer, 500)
+        if entry is None:
+            content_type, _ = mimetypes.guess_type(self.filepath)
+            return await send_file(request, writer, self.filepath, content_type or 'application/octet-stream')
+        body, content_type = entry
+        return await send_bytes(request, writer, 200, content_type, body)
+
+    def close(self): pass
+
+class StreamFanout:
+    # Ringbuffert för en ffmpeg-utdata som flera mottagare läser i egen takt. Data släpps först när
+    # den långsammaste läsaren passerat den; är bufferten full väntar kodaren (mottryck).
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.data = bytearray()
+        self.base = 0
+        self.eof = False
+        self.readers = {}
+        self.cond = asyncio.Condition()
+
+    @property
+    def end(self):
+        return self.base + len(self.data)
+
+    def attach(self):
+        # Nya läsare måste börja från strömmens första byte, annars saknas behållarens huvud.
+        if self.base > 0: return None
+        reader = object()
+        self.readers[reader] = 0
+        return reader
+
+    async def detach(self, reader):
+        async with self.cond:
+            self.readers.pop(reader, None)
+            self.cond.notify_all()
+
+    def _evict(self):
+        low = min(self.readers.values(), default=self.base)
+        if low <= self.base: return False
+        del self.data[:low - self.base]
+        self.base = low
+        return True
+
+    async def write(self, chunk):
+        async with self.cond:
+            while len(self.data) >= self.capacity and not self._evict() and not self.eof:
+                await self.cond.wait()
+            self.data += chunk
+            self.cond.notify_all()
+
+    async def read(self, reader, size):
+        async with self.cond:
+            while self.readers[reader] >= self.end and not self.eof:
+                await self.cond.wait()
+            offset = self.readers[reader] - self.base
+            chunk = bytes(self.data[offset:offset + size])
+            self.readers[reader] += len(chunk)
+            self.cond.notify_all()
+            return chunk
+
+    async def finish(self):
+        async with self.cond:
+            self.eof = True
+            self.cond.notify_all()
+
+class StreamSession:
+    # Progressiv ffmpeg-ström. En gemensam kodning skrivs till en StreamFanout som alla mottagare
+    # (flera Chromecasts eller återanslutningar) läser från; först när början redan släppts ur bufferten
+    # får en anslutning en egen process. writer.drain() gör att en långsam mottagare bromsar kodaren.
+    CHUNK_SIZE = 256 * 1024
+    FANOUT_CAPACITY = 64 * 1024 * 1024
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.server = None
+        self.pipeline = None
+        self.fanout = None
+        self.processes = set()
+        self.closed = False
+
+    def prestart(self, server):
+        self.server = server
+        server.submit(self._ensure_pipeline())
+
+    async def _spawn(self, args):
+        proc = await asyncio.create_subprocess_exec(*args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+        self.processes.add(proc)
+        if self.closed: proc.kill()
+        return proc
+
+    async def _ensure_pipeline(self):
+        if self.pipeline is None:
+            self.fanout = StreamFanout(self.FANOUT_CAPACITY)
+            self.pipeline = asyncio.ensure_future(self._run_pipeline())
+        return self.fanout
+
+    async def _run_pipeline(self):
+        # Den delade kodningen är den enda som skriver till cachefilen.
+        try:
+            proc = await self._spawn(self.plan['args'])
+        except OSError as e:
+            print(f"Kunde inte starta ffmpeg: {e}")
+            await self.fanout.finish()
+            return
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+        try:
+            while True:
+                chunk = await proc.stdout.read(self.CHUNK_SIZE)
+                if not chunk: break
+                await self.fanout.write(chunk)
+            returncode = await proc.wait()
+            self._report(returncode, await stderr_task)
+            if returncode == 0 and self.plan.get('cache_part'):
+                os.replace(self.plan['cache_part'], self.plan['cache_path'])
+                TRANSCODE_CACHE.added(self.plan['cache_path'])
+        finally:
+            await self.fanout.finish()
+            await self._finish(proc)
+            stderr_task.cancel()
+            self._remove_cache_part()
+
+    def _report(self, returncode, stderr_data):
+        if returncode != 0 and not self.closed:
+            err_text = stderr_data.decode('utf-8', 'ignore')
+            if 'Connection reset by peer' not in err_text and 'Broken pipe' not in err_text:
+                print(f"FFmpeg-fel:\n{err_text}")
+
+    async def handle(self, request, writer, resource):
+        if request.head_only:
+            write_response_head(writer, 200, {'Content-Type': self.plan['content_type']}, request.keep_alive)
+            await writer.drain()
+            return request.keep_alive
+        fanout = await self._ensure_pipeline()
+        reader = fanout.attach()
+        if reader is None: return await self._serve_private(writer)
+        try:
+            write_response_head(writer, 200, {'Content-Type': self.plan['content_type']}, False)
+            while True:
+                chunk = await fanout.read(reader, self.CHUNK_SIZE)
+                if not chunk: break
+                writer.write(chunk)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            await fanout.detach(reader)
+        return False
+
+    async def _serve_private(self, writer):
+        proc = await self._spawn(self.plan['plain_args'])
+        stderr_task = asyncio.ensure_future(proc.stderr.read())
+        try:
+            write_response_head(writer, 200, {'Content-Type': self.plan['content_type']}, False)
+            while True:
+                chunk = await proc.stdout.read(self.CHUNK_SIZE)
+                if not chunk: break
+                writer.write(chunk)
+                await writer.drain()
+            self._report(await proc.wait(), await stderr_task)
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            await self._finish(proc)
+            stderr_task.cancel()
+        return False
+
+    async def _finish(self, proc):
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        self.processes.discard(proc)
+
+    def _remove_cache_part(self):
+        part = self.plan.get('cache_part')
+        if part and os.path.exists(part):
+            try: os.remove(part)
+            except OSError: pass
+
+    async def _shutdown(self):
+        for proc in list(self.processes):
+            if proc.returncode is None: proc.kill()
+        if self.fanout: await self.fanout.finish()
+
+    def close(self):
+        self.closed = True
+        if self.server: self.server.submit(self._shutdown())
+
+# --- Läs-före-proxy för webbkällor ---
+def remote_source_key(media_data):
+    # Originaladress och format, inte format-URL:en: den byts ut varje gång informationen förnyas.
+    key_data = json.dumps([media_data.get('original_url') or media_data['src'], media_data.get('format_id')])
+    return hashlib.sha1(key_data.encode('utf-8')).hexdigest()
+
+def remote_source_proxyable(media_data):
+    # Bara vanliga filer över HTTP; HLS/DASH-manifest har relativa segmentadresser som inte går via proxyn.
+    if media_data.get('type') != 'web': return False
+    protocol = media_data.get('protocol')
+    if protocol: return protocol in ('http', 'https')
+    parsed = urlparse(media_data.get('src') or '')
+    return parsed.scheme in ('http', 'https') and not parsed.path.endswith(('.m3u8', '.mpd'))
+
+RANGE_TOTAL_RE = re.compile(r"bytes \d+-\d+/(\d+)$")
+
+class RemoteSourceCache:
+    # Gles diskcache för en webbkälla: en fil per hämtad bit (REMOTE_CHUNK_SIZE) och källans storlek i meta.json.
+    # Hela katalogen är en post i en DiskLruStore.
+    def __init__(self, store, key):
+        self.store = store
+        self.directory = store.path_for(key)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        store.touch(self.directory)
+        self.size = None
+        try:
+            with open(self.directory / "meta.json", 'r', encoding='utf-8') as f: self.size = json.load(f).get('size')
+        except (IOError, json.JSONDecodeError): pass
+
+    @property
+    def chunk_count(self):
+        return math.ceil(self.size / REMOTE_CHUNK_SIZE) if self.size is not None else None
+
+    def chunk_path(self, index):
+        return self.directory / f"{index}.bin"
+
+    def has(self, index):
+        return self.chunk_path(index).exists()
+
+    def read(self, index):
+        try:
+            with open(self.chunk_path(index), 'rb') as f: return f.read()
+        except OSError:
+            return None
+
+    def set_size(self, size):
+        self.size = size
+        self._write(self.directory / "meta.json", json.dumps({'size': size}).encode('utf-8'))
+
+    def write(self, index, data):
+        self._write(self.chunk_path(index), data)
+        self.store.added(self.directory, size=len(data))
+
+    def _write(self, path, data):
+        # Katalogen kan ha rensats av LRU-budgeten medan källan spelades.
+        self.directory.mkdir(parents=True, exist_ok=True)
+        write_file_atomic(path, data)
+
+class RemoteSourceSession:
+    # Lokal proxy mellan ffmpeg och en webbkälla. ffmpeg läser /source med Range; bitarna hämtas från källan,
+    # sparas i en RemoteSourceCache och de närmast följande hämtas i förväg (läs-före), så en långsam källa inte
+    # stoppar kodaren och sökningar eller omstarter återanvänder det som redan hämtats.
+    # Stöder källan inte Range skickas ffmpeg vidare till den med en omdirigering.
+    def __init__(self, origin, cache):
+        self.origin = origin
+        self.cache = cache
+        self.server = None
+        self.http = requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=REMOTE_FETCH_WORKERS, thread_name_prefix='remote-fetch')
+        self.inflight = {}
+        self.direct = False
+
+    def _fetch(self, index):
+        # Körs i hämtningspoolen. Returnerar bitens data, eller None om källan inte stöder Range.
+        start = index * REMOTE_CHUNK_SIZE
+        response = self.http.get(self.origin, headers={'Range': f"bytes={start}-{start + REMOTE_CHUNK_SIZE - 1}"},
+                                 stream=True, timeout=REMOTE_FETCH_TIMEOUT)
+        with response:
+            if response.status_code == 416:
+                if self.cache.size is None: self.cache.set_size(start)
+                return b''
+            if response.status_code == 200:
+                self.direct = True
+                return None
+            response.raise_for_status()
+            m = RANGE_TOTAL_RE.match(response.headers.get('Content-Range', ''))
+            if self.cache.size is None:
+                if not m:
+                    # Okänd total längd (bytes a-b/*): utan den går det inte att svara på Range, så ffmpeg läser direkt.
+                    self.direct = True
+                    return None
+                self.cache.set_size(int(m.group(1)))
+            data = response.content
+        if len(data) == REMOTE_CHUNK_SIZE or (self.cache.size is not None and start + len(data) == self.cache.size):
+            self.cache.write(index, data)
+        return data
+
+    def _load(self, index):
+        future = self.inflight.get(index)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(self.executor, self._fetch, index)
+            self.inflight[index] = future
+            future.add_done_callback(lambda _: self.inflight.pop(index, None))
+        return future
+
+    def _read_ahead(self, index):
+        # Bara så många förhämtningar som poolen har trådar, så en bit som behövs efter en sökning inte köar bakom dem.
+        count = self.cache.chunk_count
+        if count is None: return
+        for i in range(index + 1, min(index + 1 + REMOTE_READAHEAD_CHUNKS, count)):
+            if len(self.inflight) >= REMOTE_FETCH_WORKERS: break
+            if i not in self.inflight and not self.cache.has(i): self._load(i)
+
+    async def _chunk(self, index):
+        data = self.cache.read(index)
+        future = self._load(index) if data is None else None
+        self._read_ahead(index)
+        # shield: en avbruten anslutning avbryter inte hämtningen, biten hamnar ändå i cachen.
+        return data if future is None else await asyncio.shield(future)
+
+    async def handle(self, request, writer, resource):
+        keep_alive = request.keep_alive
+        if self.cache.size is None and not self.direct:
+            try:
+                await self._chunk(0)
+            except (requests.RequestException, OSError) as e:
+                print(f"Kunde inte hämta webbkällan: {e}")
+                return await send_error(request, writer, 502)
+        if self.direct or self.cache.size is None:
+            self.direct = True
+            write_response_head(writer, 302, {'Location': self.origin, 'Content-Length': 0}, keep_alive)
+            await writer.drain()
+            return keep_alive
+        size = self.cache.size
+        byte_range = parse_range_header(request.headers.get('range'), size)
+        if byte_range == 'invalid':
+            write_response_head(writer, 416, {'Content-Range': f"bytes */{size}", 'Content-Length': 0}, keep_alive)
+            await writer.drain()
+            return keep_alive
+        start, end = byte_range or (0, size - 1)
+        headers = {'Content-Type': 'application/octet-stream', 'Accept-Ranges': 'bytes', 'Content-Length': max(0, end - start + 1)}
+        if byte_range: headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+        write_response_head(writer, 206 if byte_range else 200, headers, keep_alive)
+        await writer.drain()
+        if request.head_only: return keep_alive
+        position = start
+        while position <= end:
+            index = position // REMOTE_CHUNK_SIZE
+            try:
+                data = await self._chunk(index)
+            except (requests.RequestException, OSError) as e:
+                print(f"Kunde inte hämta webbkällan: {e}")
+                return False
+            offset = position - index * REMOTE_CHUNK_SIZE
+            piece = data[offset:offset + end - position + 1] if data else b''
+            if not piece: return False
+            writer.write(piece)
+            await writer.drain()
+            position += len(piece)
+        return keep_alive
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.http.close()
+
+REMOTE_CACHE = DiskLruStore(REMOTE_CACHE_DIR, REMOTE_CACHE_MAX_BYTES)
+
+class MediaServer:
+    # En enda långlivad server för all media. Varje uppspelning registreras som en session och nås via
+    # /session/<id>/<resurs>; anslutningar hålls vid liv (keep-alive) mellan förfrågningar.
+    KEEPALIVE_TIMEOUT = 60
+
+    def __init__(self):
+        self.loop = None
+        self.port = None
+        self.sessions = {}
+
+    def start(self, port=0):
+        started = threading.Event()
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            try:
+                try:
+                    server = loop.run_until_complete(asyncio.start_server(self.handle_client, host='0.0.0.0', port=port))
+                except OSError:
+                    server = loop.run_until_complete(asyncio.start_server(self.handle_client, host='0.0.0.0', port=0))
+                self.port = server.sockets[0].getsockname()[1]
+                self.loop = loop
+            finally:
+                started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, daemon=True).start()
+        started.wait()
+
+    def stop(self):
+        for session_id in list(self.sessions): self.unregister(session_id).close()
+        if self.loop: self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def register(self, session):
+        if hasattr(session, 'server'): session.server = self
+        session_id = uuid.uuid4().hex
+        self.sessions[session_id] = session
+        return session_id
+
+    def unregister(self, session_id):
+        return self.sessions.pop(session_id, None)
+
+    def url_for(self, session_id, resource, host):
+        return f"http://{host}:{self.port}/session/{session_id}/{resource}"
+
+    async def handle_client(self, reader, writer):
+        try:
+            while True:
+                request = await read_http_request(reader, self.KEEPALIVE_TIMEOUT)
+                if request is None: break
+                if not await self.dispatch(request, writer): break
+        except (ConnectionError, OSError, asyncio.IncompleteReadError):
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            writer.close()
+
+    async def dispatch(self, request, writer):
+        if request.method == 'OPTIONS':
+            # Förhandsfråga (preflight) inför en XHR med Range-huvud.
+            headers = {'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS', 'Content-Length': 0,
+                       'Access-Control-Allow-Headers': request.headers.get('access-control-request-headers', 'Range'),
+                       'Access-Control-Max-Age': 86400}
+            write_response_head(writer, 204, headers, request.keep_alive)
+            await writer.drain()
+            return request.keep_alive
+        if request.method not in ('GET', 'HEAD'):
+            return await send_error(request, writer, 405)
+        m = re.match(r"/session/([0-9a-f]+)/(.*)$", urlparse(request.target).path)
+        session = self.sessions.get(m.group(1)) if m else None
+        if session is None:
+            return await send_error(request, writer, 404)
+        return await session.handle(request, writer, unquote(m.group(2)))
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -319,14 +2906,24 @@ class MainWindow(QMainWindow):
         self.ensure_config_dirs()
         default_settings = {
             'volume': 50, 'theme': 'Mörkt', 'eq_bas': 0, 'eq_mellan': 0, 'eq_diskant': 0, 
-            'cookies_path': '', 'image_autoplay_duration': 10
+            'cookies_path': '', 'image_autoplay_duration': 10, 'transcode_cache_max_mb': TRANSCODE_CACHE_DEFAULT_MB
         }
         self.settings = self.load_json(SETTINGS_FILE, default_settings)
-        self.resume_points = self.load_json(RESUME_FILE, {})
+        TRANSCODE_CACHE.max_bytes = self.settings.get('transcode_cache_max_mb', TRANSCODE_CACHE_DEFAULT_MB) * 1024 * 1024
+        self.resume_points = {k: e for k, e in self.load_json(RESUME_FILE, {}).items() if isinstance(e, dict) and 'position' in e}
+        self.settings_state = JsonStateFile(SETTINGS_FILE, self.settings)
+        self.resume_state = JsonStateFile(RESUME_FILE, self.resume_points)
+        # Senast kända adress per enhet, så att den senast använda kan anslutas direkt vid start.
+        self.known_devices = self.load_json(DEVICES_FILE, {})
+        self.devices_state = JsonStateFile(DEVICES_FILE, self.known_devices)
 
-        self.browser, self.cast_device, self.media_controller, self.status_listener = None, None, None, None
+        self.discovery, self.discovery_settled, self.cast_device, self.media_controller, self.status_listener = None, False, None, None, None
         self.last_player_state = None
         self.found_casts = []
+        self.group_casts = {}
+        self.group_connecting = set()
+        self.remote_sources = OrderedDict()
+        self.current_media = None
         
         self.signals = Communication()
         self.signals.media_status_update.connect(self.update_media_status)
@@ -334,13 +2931,61 @@ class MainWindow(QMainWindow):
         self.signals.media_load_error.connect(self.show_error_message)
         
         self.current_index, self.videos = -1, []
-        self.is_playing, self.server_proc, self.remote_proc = False, None, None
+        self.playlist_model = PlaylistModel(self.videos, self)
+        self.playlist_model.videos_moved.connect(self.on_playlist_reordered)
+        self.pending_items = []
+        self.refreshed_items = False
+        self.search_index = SearchIndex()
+        self.search_query, self.search_matches = '', None
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.apply_search)
+        self.pending_flush_timer = QTimer(self)
+        self.pending_flush_timer.setSingleShot(True)
+        self.pending_flush_timer.timeout.connect(self.flush_pending_items)
+        self.known_sources = set()
+        self.active_scanners = []
+        self.failed_items = []
+        self.cast_when_ready = None
+        self.library_load = None
+        self.import_scheduler = ImportScheduler(self)
+        self.import_scheduler.item_ready.connect(self.on_import_ready)
+        self.import_scheduler.progress.connect(lambda done, total: self.update_status_label())
+        self.visible_rows_timer = QTimer(self)
+        self.visible_rows_timer.setSingleShot(True)
+        self.visible_rows_timer.timeout.connect(self.prioritize_visible_rows)
+        self.is_playing, self.remote_proc = False, None
         self.seek_lock, self.slider_is_pressed, self.total_secs = False, False, 0
         self.image_autoplay_timer = None
+        self.current_plan = None
+        self.media_server = MediaServer()
+        self.media_server.start()
+        self.current_session_id, self.current_session = None, None
+        self.prefetched = None
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.timeout.connect(self.prefetch_next)
 
         self.init_ui()
         self.apply_theme()
+        self.discovery = DeviceDiscovery()
+        self.discovery.signals.device_found.connect(self.on_device_found)
+        self.discovery.signals.device_lost.connect(self.on_device_lost)
+        self.connect_last_device()
         self.on_scan()
+        QTimer.singleShot(DISCOVERY_SETTLE_MS, self.on_discovery_settled)
+
+        self.metadata_save_timer = QTimer(self)
+        self.metadata_save_timer.timeout.connect(lambda: self.execute_in_background(METADATA_CACHE.save, on_result=lambda _: None))
+        self.metadata_save_timer.timeout.connect(lambda: self.execute_in_background(URL_INFO_CACHE.save, on_result=lambda _: None))
+        self.metadata_save_timer.start(15000)
+        self.state_save_timer = QTimer(self)
+        self.state_save_timer.timeout.connect(self.flush_state)
+        self.state_save_timer.start(STATE_SAVE_INTERVAL_MS)
+        warm_ytdlp()
+
+        self.folder_watchers = {}
+        for folder in self.settings.get('watched_folders', []): self.watch_folder(folder)
 
     def init_ui(self):
         self.setAcceptDrops(True)
@@ -351,7 +2996,10 @@ class MainWindow(QMainWindow):
         self.device_combo, self.btn_scan = QComboBox(), QPushButton("Uppdatera")
         self.device_combo.currentIndexChanged.connect(self.on_device_changed)
         self.btn_scan.clicked.connect(self.on_scan)
-        h_top.addWidget(self.device_combo), h_top.addWidget(self.btn_scan), h_top.addStretch()
+        self.btn_group = QPushButton("Fler enheter")
+        self.group_menu = QMenu(self)
+        self.btn_group.setMenu(self.group_menu)
+        h_top.addWidget(self.device_combo), h_top.addWidget(self.btn_group), h_top.addWidget(self.btn_scan), h_top.addStretch()
         self.btn_remote = QPushButton("Fjärrkontroll")
         self.btn_remote.clicked.connect(self.toggle_remote)
         h_top.addWidget(self.btn_remote)
@@ -373,16 +3021,20 @@ class MainWindow(QMainWindow):
         layout_main.addLayout(h_search)
 
         # --- Playlist ---
-        self.playlist = QListWidget()
-        self.playlist.setDragDropMode(QListWidget.InternalMove)
-        self.playlist.itemDoubleClicked.connect(lambda item: self.cast_video(self.playlist.row(item)))
-        self.playlist.model().rowsMoved.connect(self.on_playlist_reordered)
-        self.playlist.itemSelectionChanged.connect(self.on_playlist_selection_changed)
+        self.playlist = QListView()
+        self.playlist.setModel(self.playlist_model)
+        self.playlist.setUniformItemSizes(True)
+        self.playlist.setLayoutMode(QListView.Batched)
+        self.playlist.setDragDropMode(QListView.InternalMove)
+        self.playlist.doubleClicked.connect(lambda mi: self.cast_video(self.playlist_model.video_index(mi.row())))
+        self.playlist.selectionModel().currentChanged.connect(self.on_playlist_selection_changed)
+        self.playlist_model.modelReset.connect(self.on_playlist_selection_changed)
+        self.playlist.verticalScrollBar().valueChanged.connect(lambda _: self.visible_rows_timer.start(100))
         self.playlist.setIconSize(QSize(128, 72))
         layout_main.addWidget(self.playlist)
         # --- Add files buttons ---
         h_add = QHBoxLayout()
-        buttons = [("Lägg till URL", self.on_add_url), ("Lägg till filer", self.on_add_file), ("Lägg till mapp", self.on_add_dir),
+        buttons = [("Lägg till URL", self.on_add_url), ("Lägg till webbspellista", self.on_add_web_playlist), ("Lägg till filer", self.on_add_file), ("Lägg till mapp", self.on_add_dir), ("Bevaka mapp", self.on_watch_dir),
                    ("Spara lista", self.on_save_list), ("Ladda lista", self.on_load_list), ("Ställ in Cookies", self.on_set_cookies)]
         for text, cb in buttons:
             btn = QPushButton(text)
@@ -490,26 +3142,48 @@ class MainWindow(QMainWindow):
     def update_status_label(self):
         count = len(self.videos)
         text = "fil" if count == 1 else "filer"
-        self.status_label.setText(f"{count} {text} laddade")
+        scheduler = self.import_scheduler
+        progress = f" – analyserar {scheduler.done}/{scheduler.total}" if scheduler.total else ""
+        self.status_label.setText(f"{count} {text} laddade{progress}")
+
+    def selected_video_index(self):
+        return self.playlist_model.video_index(self.playlist.currentIndex().row())
+
+    def select_video(self, index):
+        row = self.playlist_model.row_of(index)
+        if row < 0:
+            self.playlist.setCurrentIndex(QModelIndex())
+            return
+        model_index = self.playlist_model.index(row)
+        self.playlist.setCurrentIndex(model_index)
+        self.playlist.scrollTo(model_index)
 
     def on_search_changed(self, text):
-        search_term = text.lower()
-        for i in range(self.playlist.count()):
-            item = self.playlist.item(i)
-            if search_term in item.text().lower():
-                item.setHidden(False)
-            else:
-                item.setHidden(True)
+        self.search_timer.start(150)
+
+    def apply_search(self):
+        query = normalize_search_text(self.search_input.text().strip())
+        if not query:
+            self.search_query, self.search_matches = '', None
+            self.playlist_model.set_filter(None)
+            return
+        # En längre fråga som innehåller den förra kan bara smalna av det tidigare resultatet.
+        within = self.search_matches if self.search_matches is not None and self.search_query in query else None
+        matches = self.search_index.search(query, within)
+        self.search_query, self.search_matches = query, matches
+        self.playlist_model.set_filter(lambda v: id(v) in matches)
 
     def on_rotation_changed(self, index):
-        row = self.playlist.currentRow()
+        row = self.selected_video_index()
         if 0 <= row < len(self.videos):
             rotation_map = {0: 0, 1: 90, 2: 180, 3: 270}
             rotation = rotation_map.get(index, 0)
             self.videos[row]['rotation'] = rotation
 
-    def on_playlist_selection_changed(self):
-        row = self.playlist.currentRow()
+    def on_playlist_selection_changed(self, *args):
+        row = self.selected_video_index()
+        if 0 <= row < len(self.videos) and self.videos[row].get('pending'):
+            self.import_scheduler.prioritize([self.videos[row]], ImportScheduler.URGENT)
         self.rotation_combo.blockSignals(True)
         if 0 <= row < len(self.videos):
             rotation = self.videos[row].get('rotation', 0)
@@ -525,7 +3199,7 @@ class MainWindow(QMainWindow):
         self.rotation_combo.blockSignals(False)
 
     def on_play_locally(self):
-        row = self.playlist.currentRow()
+        row = self.selected_video_index()
         if row < 0:
             QMessageBox.information(self, "Inget valt", "Välj en fil i spellistan att spela upp lokalt.")
             return
@@ -561,14 +3235,14 @@ class MainWindow(QMainWindow):
     def open_eq_dialog(self):
         dialog = EQDialog(self.settings, self)
         if dialog.exec_() == QDialog.Accepted:
-            self.save_json(SETTINGS_FILE, self.settings)
+            self.flush_state()
             QMessageBox.information(self, "EQ Sparad", "Dina equalizer-inställningar har sparats.")
 
     def on_set_cookies(self):
         path, _ = QFileDialog.getOpenFileName(self, "Välj cookies-fil", "", "Textfiler (*.txt);;Alla filer (*)")
         if path:
             self.settings['cookies_path'] = path
-            self.save_json(SETTINGS_FILE, self.settings)
+            self.flush_state()
             QMessageBox.information(self, "Cookies sparade", f"Sökvägen till din cookies-fil har sparats:\n{path}")
 
     def show_error_message(self, title, message):
@@ -595,9 +3269,16 @@ class MainWindow(QMainWindow):
             for link in web_links: self.on_add_url(url=link)
     
     def add_files(self, filelist):
+        # Filerna visas direkt som platshållare; analysen körs av schemaläggaren i prioritetsordning.
+        items = []
         for fn in filelist:
-            if not any(fn == v.get('src') for v in self.videos):
-                self.execute_in_background(get_info, fn, is_url=False, on_result=self.on_info_ready)
+            key = os.path.abspath(fn)
+            if key in self.known_sources: continue
+            self.known_sources.add(key)
+            items.append(pending_local_info(fn))
+        if not items: return
+        for v in items: self.queue_playlist_item(v)
+        self.import_scheduler.submit(items)
 
     def on_add_url(self, url=None):
         if not url:
@@ -606,6 +3287,33 @@ class MainWindow(QMainWindow):
         cookies_path = self.settings.get('cookies_path')
         self.execute_in_background(get_info, url, is_url=True, cookies_path=cookies_path, on_result=self.on_url_info_ready)
     
+    def on_add_web_playlist(self):
+        url, ok = QInputDialog.getText(self, "Lägg till webbspellista", "Länk till spellista eller kanal:")
+        if not (ok and url): return
+        labels = [label for _, label in WEB_FORMAT_PREFERENCES]
+        keys = [key for key, _ in WEB_FORMAT_PREFERENCES]
+        current = self.settings.get('web_format_preference', 'best')
+        label, ok = QInputDialog.getItem(self, "Format", "Format för alla poster:", labels, keys.index(current) if current in keys else 0, False)
+        if not ok: return
+        preference = keys[labels.index(label)]
+        self.settings['web_format_preference'] = preference
+        self.execute_in_background(list_playlist_entries, url, self.settings.get('cookies_path'),
+                                   on_result=lambda result: self.on_web_playlist_listed(result, preference))
+
+    def on_web_playlist_listed(self, result, preference):
+        # Posterna visas direkt och extraheras sedan parallellt (begränsat av yt-dlp-poolen) i spellistans ordning.
+        data, err = result
+        if data is None:
+            QMessageBox.critical(self, "Fel", f"Kunde inte läsa spellistan:\n{err}")
+            return
+        if not data['entries']:
+            QMessageBox.warning(self, "Tom spellista", "Hittade inga poster i länken.")
+            return
+        items = [pending_web_info(entry, preference) for entry in data['entries']]
+        for v in items: self.queue_playlist_item(v)
+        self.import_scheduler.cookies_path = self.settings.get('cookies_path')
+        self.import_scheduler.submit(items)
+
     def on_url_info_ready(self, info):
         if info.get('is_error'):
             QMessageBox.critical(self, "Fel", info.get('error_message', 'Okänt fel vid URL-hämtning.'))
@@ -616,27 +3324,69 @@ class MainWindow(QMainWindow):
         dialog = FormatSelectorDialog(info['formats'], self)
         if dialog.exec_() == QDialog.Accepted and dialog.selected_format:
             selected = dialog.selected_format
-            info.update({'src': selected['url'], 'media_type': selected['media_type'],
+            info.update({'src': selected['url'], 'media_type': selected['media_type'], 'streams': selected.get('streams', []),
+                         'format_id': selected.get('format_id'), 'protocol': selected.get('protocol'),
                          'title': info['title'], 'original_url': info['original_url']})
             info['rotation'] = 0
-            self.videos.append(info)
-            self.add_item_to_playlist(info)
+            self.queue_playlist_item(info)
 
-    def on_info_ready(self, info):
-        if not info.get('is_error'):
-            info['rotation'] = 0
-            self.videos.append(info)
-            self.add_item_to_playlist(info)
-
-    def add_item_to_playlist(self, v):
-        display_text = f"{v.get('title', 'Okänd Titel')}\n({v.get('length_str', '--:--')})"
-        item = QListWidgetItem(display_text)
-        if v.get('thumbnail_path') and Path(v['thumbnail_path']).exists():
-            item.setIcon(QIcon(v['thumbnail_path']))
-        self.playlist.addItem(item)
-        # Apply current filter to new item
-        self.on_search_changed(self.search_input.text())
-        self.update_status_label() # ÄNDRING: Uppdatera räknaren
+    def on_import_ready(self, v, info):
+        if info is None or info.get('is_error'):
+            if v.get('stored'):
+                # Lagrad metadata finns kvar; raden behålls och förnyas igen nästa gång den behövs.
+                v.pop('pending', None)
+                self.refreshed_items = True
+                if info and self.cast_when_ready and self.cast_when_ready[0] is v:
+                    self.show_error_message("Fel", f"Kunde inte förnya {v.get('title')}:\n{info.get('error_message', 'Okänt fel')}")
+            else:
+                self.failed_items.append(v)
+            if self.cast_when_ready and self.cast_when_ready[0] is v: self.cast_when_ready = None
+        else:
+            v.update(info)
+            v.pop('pending', None)
+            v.pop('stored', None)
+            self.refreshed_items = True
+        if not self.pending_flush_timer.isActive(): self.pending_flush_timer.start(100)
+        if self.cast_when_ready and self.cast_when_ready[0] is v and not v.get('pending'):
+            item, start_time = self.cast_when_ready
+            self.cast_when_ready = None
+            self.cast_video(self.videos.index(item), start_time)
+
+    def revalidate_web_item(self, v, priority):
+        # Utgången webbadress: hämtas om i schemaläggaren medan raden behåller sin lagrade metadata.
+        v['pending'] = True
+        self.import_scheduler.cookies_path = self.settings.get('cookies_path')
+        self.import_scheduler.submit([v], priority)
+
+    def prioritize_visible_rows(self):
+        if not self.import_scheduler.tasks: return
+        viewport = self.playlist.viewport().rect()
+        first = self.playlist.indexAt(viewport.topLeft()).row()
+        if first < 0: return
+        last = self.playlist.indexAt(viewport.bottomLeft()).row()
+        if last < 0: last = self.playlist_model.rowCount() - 1
+        items = [self.videos[self.playlist_model.video_index(row)] for row in range(first, last + 1)]
+        self.import_scheduler.prioritize(items, ImportScheduler.VISIBLE)
+
+    def queue_playlist_item(self, v):
+        # Resultat samlas ihop och infogas i en enda beginInsertRows per omgång.
+        self.pending_items.append(v)
+        if not self.pending_flush_timer.isActive(): self.pending_flush_timer.start(100)
+
+    def flush_pending_items(self):
+        items, self.pending_items = self.pending_items, []
+        self.search_index.add(items)
+        if self.search_matches is not None:
+            self.search_matches |= self.search_index.search(self.search_query, {id(v) for v in items})
+        self.playlist_model.append_videos(items)
+        if self.refreshed_items:
+            self.refreshed_items = False
+            self.playlist_model.refresh()
+        if self.failed_items:
+            failed, self.failed_items = {id(v) for v in self.failed_items}, []
+            self.remove_video_rows([i for i, v in enumerate(self.videos) if id(v) in failed])
+        if items and self.import_scheduler.tasks: self.visible_rows_timer.start(100)
+        self.update_status_label()
 
 
     def on_worker_error(self, error_tuple):
@@ -650,17 +3400,55 @@ class MainWindow(QMainWindow):
         self.threadpool.start(worker)
 
     def on_scan(self):
+        # Sökningen pågår hela tiden; knappen startar bara om den, t.ex. efter byte av nätverk.
         self.btn_scan.setText("Söker..."), self.btn_scan.setEnabled(False)
-        worker = Worker(lambda: pychromecast.get_chromecasts(tries=1))
-        worker.signals.result.connect(self.on_scan_finished)
-        worker.signals.error.connect(self.on_worker_error)
-        self.threadpool.start(worker)
-        
-    def on_scan_finished(self, result):
-        casts, self.browser = result
-        self.found_casts = sorted([c for c in casts if c.cast_type != 'group'], key=lambda c: c.name)
+        try:
+            if self.discovery.browser: self.discovery.restart()
+            else: self.discovery.start()
+        except Exception as e:
+            QMessageBox.critical(self, "Fel", f"Kunde inte starta sökning efter enheter: {e}")
+        QTimer.singleShot(2000, lambda: (self.btn_scan.setText("Uppdatera"), self.btn_scan.setEnabled(True)))
+
+    def on_discovery_settled(self):
+        # Den senast använda enheten har fått en chans att dyka upp; annars väljs den första som hittats.
+        self.discovery_settled = True
+        if not self.cast_device: self.update_device_list()
+
+    def connect_last_device(self):
+        key = self.settings.get('last_used_device_uuid')
+        entry = self.known_devices.get(key) if key else None
+        if not entry: return
+        host = (entry['host'], entry['port'], uuid.UUID(key), entry.get('model_name'), entry.get('friendly_name'))
+        self.execute_in_background(connect_known_device, host, on_result=self.on_known_device_ready)
+
+    def on_known_device_ready(self, cast):
+        if cast is None: return
+        if any(c.uuid == cast.uuid for c in self.found_casts):
+            # Sökningen hann före; dess objekt används.
+            threading.Thread(target=cast.disconnect, daemon=True).start()
+            return
+        self.add_found_cast(cast)
+
+    def on_device_found(self, cast_info):
+        key = str(cast_info.uuid)
+        entry = {'host': cast_info.host, 'port': cast_info.port, 'friendly_name': cast_info.friendly_name,
+                 'model_name': cast_info.model_name, 'cast_type': cast_info.cast_type}
+        if self.known_devices.get(key) != entry: self.known_devices[key] = entry
+        if any(str(c.uuid) == key for c in self.found_casts): return
+        self.add_found_cast(pychromecast.get_chromecast_from_cast_info(cast_info, self.discovery.zconf))
+
+    def add_found_cast(self, cast):
+        self.found_casts = sorted(self.found_casts + [cast], key=lambda c: c.name or '')
+        self.update_device_list()
+
+    def on_device_lost(self, key):
+        # Anslutna enheter behålls; mDNS-svar kan utebli tillfälligt och anslutningen återupptas själv.
+        if self.cast_device and str(self.cast_device.uuid) == key: return
+        if key in self.group_casts: return
+        remaining = [c for c in self.found_casts if str(c.uuid) != key]
+        if len(remaining) == len(self.found_casts): return
+        self.found_casts = remaining
         self.update_device_list()
-        self.btn_scan.setText("Uppdatera"), self.btn_scan.setEnabled(True)
 
     def update_device_list(self):
         self.device_combo.blockSignals(True)
@@ -684,28 +3472,110 @@ class MainWindow(QMainWindow):
             self.device_combo.setCurrentIndex(last_idx)
         elif self.device_combo.findText(current_text) != -1:
              self.device_combo.setCurrentText(current_text)
-        elif self.found_casts:
+        elif self.discovery_settled or last_uuid not in self.known_devices:
             self.device_combo.setCurrentIndex(0)
+        else:
+            self.device_combo.setCurrentIndex(-1)
 
         self.device_combo.blockSignals(False)
         self.on_device_changed(self.device_combo.currentIndex())
 
+    # --- Flera enheter: en kodning, flera mottagare ---
+    def update_group_menu(self):
+        self.group_menu.clear()
+        wanted = set(self.settings.get('group_device_uuids', []))
+        primary = str(self.cast_device.uuid) if self.cast_device else None
+        for cast in self.found_casts:
+            key = str(cast.uuid)
+            if key == primary: continue
+            action = self.group_menu.addAction(cast.name)
+            action.setCheckable(True)
+            # Markeringen sätts innan toggled kopplas; menyn byggs om ofta medan enheter upptäcks.
+            action.setChecked(key in self.group_casts or key in wanted)
+            action.toggled.connect(lambda checked, c=cast: self.on_group_device_toggled(c, checked))
+            if key in wanted: self.connect_group_device(cast)
+        self.btn_group.setEnabled(bool(self.group_menu.actions()))
+
+    def connect_group_device(self, cast):
+        # Varje enhet ansluts en gång, även om menyn byggs om medan anslutningen pågår.
+        key = str(cast.uuid)
+        if key in self.group_casts or key in self.group_connecting: return
+        self.group_connecting.add(key)
+        self.execute_in_background(connect_cast, cast, on_result=self.on_group_device_ready)
+
+    def on_group_device_toggled(self, cast, checked):
+        key = str(cast.uuid)
+        wanted = [u for u in self.settings.get('group_device_uuids', []) if u != key]
+        if checked:
+            self.settings['group_device_uuids'] = wanted + [key]
+            self.connect_group_device(cast)
+        else:
+            self.settings['group_device_uuids'] = wanted
+            self.remove_group_device(key)
+
+    def on_group_device_ready(self, cast):
+        key = str(cast.uuid)
+        self.group_connecting.discard(key)
+        if key in self.group_casts: return
+        if key not in self.settings.get('group_device_uuids', []) or (self.cast_device and self.cast_device.uuid == cast.uuid): return
+        self.group_casts[key] = cast
+        cast.set_volume(self.settings.get('volume', 80) / 100.0)
+        # En enhet som läggs till under uppspelning hämtar samma session som de övriga.
+        if self.is_playing and self.current_media:
+            url, media_type, title = self.current_media
+            position = self.media_controller.status.adjusted_current_time if self.media_controller and self.media_controller.status else 0
+            cast.media_controller.play_media(url, media_type, title=title, current_time=position or 0)
+
+    def remove_group_device(self, key):
+        cast = self.group_casts.pop(key, None)
+        if not cast: return
+        def release():
+            try:
+                if cast.media_controller.is_active: cast.media_controller.stop()
+            except Exception: pass
+            cast.disconnect()
+        threading.Thread(target=release, daemon=True).start()
+
+    def receiver_max_size(self):
+        sizes = [receiver_resolution(cast) for cast in self.active_casts()] or [RECEIVER_RESOLUTION_HD]
+        return max(sizes)
+
+    def prefetch_images(self, start_index):
+        # Nästa bilder i ett bildspel skalas i förväg så att övergången bara blir en cacheträff.
+        max_size = self.receiver_max_size()
+        for v in self.videos[start_index:start_index + IMAGE_PREFETCH_COUNT]:
+            if v.get('media_type') != 'image' or v.get('type') != 'local': continue
+            self.execute_in_background(IMAGE_CACHE.prefetch, v['src'], v.get('rotation', 0), max_size, on_result=lambda _: None)
+
+    def active_casts(self):
+        casts = [self.cast_device] if self.cast_device else []
+        return casts + [c for c in self.group_casts.values() if c.socket_client.is_connected]
+
+    def broadcast(self, action):
+        for cast in self.active_casts():
+            try: action(cast.media_controller)
+            except Exception as e: print(f"Kommandot misslyckades på {cast.name}: {e}")
+
     def on_device_changed(self, idx):
         if not (0 <= idx < len(self.found_casts)):
             if self.cast_device:
                 threading.Thread(target=self.cast_device.disconnect, daemon=True).start()
             self.cast_device = None
             self.media_controller = None
+            self.update_group_menu()
             return
 
         selected_device = self.found_casts[idx]
 
         if self.cast_device and self.cast_device.uuid == selected_device.uuid:
+            self.update_group_menu()
             return
 
         if self.cast_device:
             threading.Thread(target=self.cast_device.disconnect, daemon=True).start()
 
+        # En enhet som redan ingår i gruppen blir huvudenhet och lämnar gruppen.
+        self.group_casts.pop(str(selected_device.uuid), None)
         self.cast_device = selected_device
         QApplication.setOverrideCursor(Qt.WaitCursor)
         try:
@@ -723,28 +3593,39 @@ class MainWindow(QMainWindow):
             self.media_controller = None
         finally:
             QApplication.restoreOverrideCursor()
+        self.update_group_menu()
 
-    def cast_video(self, index, start_time=0):
+    def cast_video(self, index, start_time=None):
+        # start_time=None: fortsätt från sparad återupptagningspunkt; en uttrycklig tid (även 0) gäller som den är.
         if not self.cast_device or not self.cast_device.socket_client.is_connected:
             self.show_error_message("Ingen Chromecast", "Välj en Chromecast först.")
             return
         if not (0 <= index < len(self.videos)): return
+        if web_item_needs_refresh(self.videos[index]): self.revalidate_web_item(self.videos[index], ImportScheduler.URGENT)
+        if self.videos[index].get('pending'):
+            # Posten analyseras fortfarande; den spelas upp så snart analysen är klar.
+            self.cast_when_ready = (self.videos[index], start_time)
+            self.import_scheduler.prioritize([self.videos[index]], ImportScheduler.URGENT)
+            return
         
         self.cancel_image_timer()
-        if self.server_proc: 
-            try:
-                self.server_proc.shutdown()
-                self.server_proc.server_close()
-            except Exception: pass
-            self.server_proc = None
+        self.stop_local_stream()
         
         self.current_index = index
         v = self.videos[index]
         self.total_secs = v.get('length', 0)
+        if start_time is None:
+            # Fortsätt där objektet lämnades senast, även om programmet kraschade.
+            resume = v.get('media_type') != 'image' and self.settings.get('resume_enabled', True)
+            start_time = self.resume_points.get(resume_key(v), {}).get('position', 0) if resume else 0
 
-        media_url = self.start_local_stream(v, start_time)
+        plan = self.take_prefetched(v, start_time)
+        self.discard_prefetched()
+        if plan is None and v.get('media_type') != 'image':
+            plan = plan_transcode(self.proxied_source(v), self.settings, start_time)
+        self.current_plan = plan
+        media_url = self.start_local_stream(v, plan)
         
-        media_type = 'video/mp4'
         if v.get('media_type') == 'image':
             img_path = Path(v['src'])
             media_type, _ = mimetypes.guess_type(img_path.name)
@@ -754,16 +3635,18 @@ class MainWindow(QMainWindow):
             self.slider.setValue(0)
             self.lbl_time.setText("Bildvisning")
         elif v.get('media_type') == 'audio':
-            media_type = 'audio/aac'
+            media_type = plan['content_type']
             self.slider.setEnabled(True)
             self.slider.setRange(0, int(self.total_secs))
         else: # video
+            media_type = plan['content_type']
             self.slider.setEnabled(True)
             self.slider.setRange(0, int(self.total_secs))
 
-        self.media_controller.play_media(media_url, media_type, title=v.get('title'), current_time=start_time)
+        self.current_media = (media_url, media_type, v.get('title'))
+        self.broadcast(lambda mc: mc.play_media(media_url, media_type, title=v.get('title'), current_time=start_time))
         self.is_playing = True
-        self.playlist.setCurrentRow(index)
+        self.select_video(index)
         self.slider.setValue(int(start_time))
 
 
@@ -773,23 +3656,105 @@ class MainWindow(QMainWindow):
             self.image_autoplay_timer.setSingleShot(True)
             self.image_autoplay_timer.timeout.connect(self.on_next)
             self.image_autoplay_timer.start(duration_ms)
+            self.prefetch_images(index + 1)
 
-    def start_local_stream(self, media_data, start_time=0):
-        if self.server_proc: 
-            try:
-                self.server_proc.shutdown()
-                self.server_proc.server_close()
-            except Exception as e:
-                print(f"Fel vid nedstängning av server: {e}")
-        
-        handler = self.create_handler(media_data, start_time)
-        self.server_proc = ThreadedTCPServer(("", 0), handler)
-        port = self.server_proc.server_address[1]
-        
-        server_thread = threading.Thread(target=self.server_proc.serve_forever, daemon=True)
-        server_thread.start()
-        
-        return f"http://{self.detect_local_ip()}:{port}/stream"
+        self.prefetch_timer.start(PREFETCH_DELAY_MS)
+
+    # --- Förberedelse av nästa objekt i spellistan ---
+    def prefetch_next(self):
+        self.discard_prefetched()
+        next_index = self.current_index + 1
+        if not self.is_playing or not (0 <= next_index < len(self.videos)): return
+        v = self.videos[next_index]
+        if v.get('media_type') == 'image': return
+        if web_item_needs_refresh(v): self.revalidate_web_item(v, ImportScheduler.URGENT)
+        if v.get('pending'):
+            self.import_scheduler.prioritize([v], ImportScheduler.URGENT)
+            return
+        if v.get('type') == 'local' and not v.get('streams'):
+            self.execute_in_background(get_info, v['src'], is_url=False, on_result=lambda info, v=v: self.on_prefetch_probed(v, info))
+            return
+        self.prefetch_item(v)
+
+    def on_prefetch_probed(self, v, info):
+        if info.get('is_error'): return
+        for key in ('length', 'length_str', 'streams', 'container', 'media_type', 'audio_codec'): v[key] = info.get(key)
+        if self.current_index + 1 < len(self.videos) and self.videos[self.current_index + 1] is v:
+            self.prefetch_item(v)
+
+    def prefetch_item(self, v):
+        plan = plan_transcode(self.proxied_source(v), self.settings, 0)
+        session = self.create_session(v, plan)
+        if plan['mode'] == 'hls':
+            segments = math.ceil(self.settings.get('prefetch_seconds', 20) / HLS_SEGMENT_SECONDS)
+            self.execute_in_background(session.prefetch, segments, on_result=lambda _: None)
+        elif plan['mode'] != 'direct':
+            # ffmpeg startas i förväg; den blockerar när röret är fullt och fortsätter när mottagaren ansluter.
+            session.prestart(self.media_server)
+        plan['session'] = session
+        self.prefetched = {'item': v, 'plan': plan}
+
+    def take_prefetched(self, v, start_time=0):
+        # Förberedda ffmpeg-strömmar börjar från början; direktfiler och HLS söker mottagaren själv i.
+        if not self.prefetched or self.prefetched['item'] is not v: return None
+        plan = self.prefetched['plan']
+        if start_time > 0.5 and plan['mode'] not in ('direct', 'hls'): return None
+        self.prefetched = None
+        return plan if plan.get('session') else None
+
+    def discard_prefetched(self):
+        if not self.prefetched: return
+        plan = self.prefetched['plan']
+        self.prefetched = None
+        session = plan.pop('session', None)
+        if session: session.close()
+
+    def stop_local_stream(self):
+        if self.current_session_id:
+            self.media_server.unregister(self.current_session_id)
+            self.current_session_id = None
+        if self.current_session:
+            self.current_session.close()
+            self.current_session = None
+
+    def proxied_source(self, v):
+        # ffmpeg läser webbkällor via läs-före-proxyn. Samma proxy används för sökningar, omstarter och förberedelse
+        # av nästa objekt; bara de senaste REMOTE_SOURCE_SESSIONS hålls registrerade (bitarna ligger kvar på disk).
+        if not remote_source_proxyable(v) or not self.settings.get('remote_proxy_enabled', True): return v
+        key = remote_source_key(v)
+        entry = self.remote_sources.pop(key, None)
+        if entry is None:
+            session = RemoteSourceSession(v['src'], RemoteSourceCache(REMOTE_CACHE, key))
+            entry = (self.media_server.register(session), session)
+        entry[1].origin = v['src']
+        self.remote_sources[key] = entry
+        while len(self.remote_sources) > REMOTE_SOURCE_SESSIONS:
+            _, (session_id, session) = self.remote_sources.popitem(last=False)
+            self.media_server.unregister(session_id)
+            session.close()
+        return dict(v, src=self.media_server.url_for(entry[0], "source", "127.0.0.1"))
+
+    def create_session(self, media_data, plan=None):
+        if media_data.get('media_type') == 'image': return ImageSession(media_data, self.receiver_max_size())
+        if plan['mode'] == 'direct': return FileSession(plan['path'], plan['content_type'])
+        if plan['mode'] == 'hls': return self.create_hls_session(plan)
+        return StreamSession(plan)
+
+    def create_hls_session(self, plan):
+        if plan.get('cache_key'):
+            work_dir = TRANSCODE_CACHE.path_for(f"{plan['cache_key']}.hls")
+            TRANSCODE_CACHE.touch(work_dir)
+            return HlsSession(plan, work_dir, persistent=True)
+        return HlsSession(plan, HLS_DIR / uuid.uuid4().hex)
+
+    def start_local_stream(self, media_data, plan=None):
+        self.stop_local_stream()
+        session = (plan.pop('session', None) if plan else None) or self.create_session(media_data, plan)
+        if isinstance(session, HlsSession): session.in_use = True
+        self.current_session = session
+        self.current_session_id = self.media_server.register(session)
+        resource = "stream.m3u8" if isinstance(session, HlsSession) else "stream"
+        return self.media_server.url_for(self.current_session_id, resource, self.detect_local_ip())
 
     def update_media_status(self, status: MediaStatus):
         if not status: return
@@ -802,6 +3767,8 @@ class MainWindow(QMainWindow):
         if self.seek_lock and status.player_state == "PLAYING":
              self.seek_lock = False
 
+        self.update_resume_point(status)
+
         if not self.slider_is_pressed and not self.seek_lock and not current_item_is_image:
             self.slider.setValue(int(status.current_time))
             if self.total_secs > 0:
@@ -813,8 +3780,10 @@ class MainWindow(QMainWindow):
         new_player_state = status.player_state
         if self.is_playing and self.last_player_state in ['PLAYING', 'BUFFERING'] and new_player_state == 'IDLE':
             if status.idle_reason == 'FINISHED':
+                 if 0 <= self.current_index < len(self.videos): self.resume_points.pop(resume_key(current_item), None)
                  if not current_item_is_image and self.autoplay_checkbox.isChecked():
-                     QTimer.singleShot(1000, self.on_next)
+                     # Är nästa objekt redan förberett behövs ingen paus innan det startas.
+                     QTimer.singleShot(0 if self.prefetched else 1000, self.on_next)
                  else:
                      self.is_playing = False
         
@@ -822,29 +3791,27 @@ class MainWindow(QMainWindow):
 
     def on_play(self):
         if self.current_index < 0 and self.videos: self.cast_video(0)
-        elif self.media_controller: self.media_controller.play()
+        elif self.media_controller: self.broadcast(lambda mc: mc.play())
 
     def on_pause(self):
         self.cancel_image_timer()
-        if self.media_controller: self.media_controller.pause()
+        if self.media_controller: self.broadcast(lambda mc: mc.pause())
             
     def on_stop(self, clear_ui=True):
         self.cancel_image_timer()
-        if self.server_proc: 
-            try:
-                self.server_proc.shutdown()
-                self.server_proc.server_close()
-            except Exception: pass
-            self.server_proc = None
+        self.prefetch_timer.stop()
+        self.discard_prefetched()
+        self.stop_local_stream()
 
-        if self.media_controller and self.media_controller.is_active: self.media_controller.stop()
+        self.broadcast(lambda mc: mc.stop() if mc.is_active else None)
+        self.current_media = None
         self.is_playing = False
         if clear_ui:
             self.slider.setEnabled(True)
             self.slider.setValue(0)
             self.lbl_time.setText("--:-- / --:--")
             self.current_index = -1
-            self.playlist.setCurrentRow(-1)
+            self.select_video(-1)
             
     def on_next(self):
         if self.current_index < len(self.videos) - 1: self.cast_video(self.current_index + 1)
@@ -857,7 +3824,11 @@ class MainWindow(QMainWindow):
         if self.is_playing and self.media_controller and self.total_secs > 0:
             seconds = max(0, min(int(self.total_secs), seconds))
             self.seek_lock = True
-            self.cast_video(self.current_index, start_time=seconds)
+            if self.current_plan and self.current_plan['mode'] in ('direct', 'hls'):
+                # Mottagaren hämtar själv rätt byte-intervall eller segment.
+                self.broadcast(lambda mc: mc.seek(seconds))
+            else:
+                self.cast_video(self.current_index, start_time=seconds)
         
     def on_slider_pressed(self): 
         self.slider_is_pressed = True
@@ -894,39 +3865,46 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, 'Felaktigt format', 'Ange tiden i ett giltigt format (HH:MM:SS, MM:SS, eller sekunder) och inom videons längd.')
         
     def set_volume(self, value):
-        if self.cast_device and self.cast_device.socket_client.is_connected:
-            self.cast_device.set_volume(value / 100.0)
+        for cast in self.active_casts():
+            if cast.socket_client.is_connected: cast.set_volume(value / 100.0)
         self.settings['volume'] = value
 
-    def repopulate_playlist(self):
-        current_sel = self.playlist.currentRow()
-        try:
-            self.playlist.model().rowsMoved.disconnect(self.on_playlist_reordered)
-        except TypeError:
-            pass
-        self.playlist.clear()
-        for v in self.videos:
-            self.add_item_to_playlist(v)
-        if 0 <= current_sel < self.playlist.count(): self.playlist.setCurrentRow(current_sel)
-        self.playlist.model().rowsMoved.connect(self.on_playlist_reordered)
-        self.on_search_changed(self.search_input.text())
-
-
-    def on_playlist_reordered(self, parent, start, end, dest, row):
-        if start == row: return
-        moved_item = self.videos.pop(start)
-        self.videos.insert(row, moved_item)
-        if self.current_index == start: self.current_index = row
-        elif start < self.current_index and row >= self.current_index: self.current_index -= 1
-        elif start > self.current_index and row <= self.current_index: self.current_index += 1
+    def on_playlist_reordered(self, new_positions, moved_rows):
+        if self.current_index >= 0: self.current_index = new_positions[self.current_index]
+        if moved_rows: self.select_video(new_positions[moved_rows[0]])
 
     def ensure_config_dirs(self):
-        for d in [CONFIG_DIR, THUMBNAIL_DIR, SUBTITLE_DIR]: d.mkdir(exist_ok=True)
+        for d in [CONFIG_DIR, THUMBNAIL_DIR, SUBTITLE_DIR, HLS_DIR, TRANSCODE_CACHE_DIR, IMAGE_CACHE_DIR, REMOTE_CACHE_DIR]: d.mkdir(exist_ok=True)
 
-    def save_json(self, fp, data):
-        try:
-            with open(fp, 'w', encoding='utf-8') as f: json.dump(data, f, indent=2)
-        except Exception as e: print(f"Kunde inte spara JSON: {e}")
+    def flush_state(self):
+        # Ändringar samlas ihop och skrivs högst en gång per STATE_SAVE_INTERVAL_MS, utan JSON-arbete i GUI-tråden.
+        # Mottagaren skickar inga periodiska lägesuppdateringar, så positionen läses av här.
+        if self.media_controller: self.update_resume_point(self.media_controller.status)
+        for state in (self.settings_state, self.resume_state, self.devices_state):
+            pending = state.take_snapshot()
+            if pending: self.execute_in_background(state.write, *pending, on_result=lambda _: None)
+
+    def update_resume_point(self, status):
+        if not (status and self.is_playing and not self.seek_lock and 0 <= self.current_index < len(self.videos)): return
+        if status.player_state not in ('PLAYING', 'PAUSED', 'BUFFERING'): return
+        v = self.videos[self.current_index]
+        if v.get('media_type') == 'image': return
+        self.record_resume_point(v, status.adjusted_current_time or 0)
+
+    def record_resume_point(self, v, position):
+        # Tidiga positioner (t.ex. första statusen innan en återupptagning hunnit söka) sparas inte men raderar inget.
+        key = resume_key(v)
+        length = v.get('length') or 0
+        if position < RESUME_MIN_SECONDS: return
+        if length and position > length - RESUME_END_MARGIN_SECONDS:
+            self.resume_points.pop(key, None)
+            return
+        entry = self.resume_points.get(key)
+        if entry and abs(entry['position'] - position) < RESUME_GRANULARITY_SECONDS: return
+        self.resume_points[key] = {'position': int(position), 'updated': int(time.time())}
+        if len(self.resume_points) > RESUME_MAX_ENTRIES:
+            oldest = sorted(self.resume_points, key=lambda k: self.resume_points[k].get('updated', 0))
+            for k in oldest[:len(self.resume_points) - RESUME_MAX_ENTRIES]: del self.resume_points[k]
 
     def load_json(self, fp, default):
         try:
@@ -947,171 +3925,74 @@ class MainWindow(QMainWindow):
                 return s.getsockname()[0]
         except Exception: return "127.0.0.1"
 
-    def create_handler(self, media_data, start_time=0):
-        main_window_ref = self
-
-        class MediaStreamHandler(http.server.BaseHTTPRequestHandler):
-            def do_GET(self):
-                if media_data.get('media_type') == 'image':
-                    self.serve_image()
-                else:
-                    self.serve_transcoded_media()
-
-            def serve_image(self):
-                try:
-                    filepath = media_data['src']
-                    rotation = media_data.get('rotation', 0)
-                    
-                    with Image.open(filepath) as img:
-                        if rotation != 0:
-                            img = img.rotate(-rotation, expand=True)
-
-                        buffer = io.BytesIO()
-                        img_format_str = Path(filepath).suffix.lower()
-                        pil_format = Image.registered_extensions().get(img_format_str, 'JPEG').upper()
-                        
-                        if (pil_format in ['PNG', 'WEBP']) or (img.mode in ('RGBA', 'P')):
-                             pil_format = 'PNG'
-
-                        img.save(buffer, format=pil_format)
-                        buffer.seek(0)
-                        img_bytes = buffer.read()
-
-                    content_type, _ = mimetypes.guess_type(f"dummy.{pil_format.lower()}")
-                    self.send_response(200)
-                    self.send_header('Content-Type', content_type or 'application/octet-stream')
-                    self.send_header('Content-Length', len(img_bytes))
-                    self.end_headers()
-                    self.wfile.write(img_bytes)
-
-                except FileNotFoundError:
-                    self.send_error(404, "File Not Found")
-                except Exception as e:
-                    print(f"Fel vid servering av roterad bild: {e}")
-                    traceback.print_exc()
-                    self.send_error(500, "Server Error")
-
-            def serve_transcoded_media(self):
-                self.send_response(200)
-                media_type = 'audio/aac' if media_data.get('media_type') == 'audio' else 'video/mp4'
-                self.send_header('Content-Type', media_type)
-                self.end_headers()
-                
-                args = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
-                if start_time > 0.5:
-                    args.extend(["-ss", str(start_time)])
-                
-                args.extend(["-i", media_data['src']])
-
-                vf, af = [], []
-
-                rotation = media_data.get('rotation', 0)
-                if media_data.get('media_type') != 'audio' and rotation != 0:
-                    if rotation == 90:
-                        vf.append("transpose=1")
-                    elif rotation == 180:
-                        vf.append("transpose=2,transpose=2")
-                    elif rotation == 270:
-                        vf.append("transpose=2")
-
-                if media_data.get('subtitle_path'):
-                    subtitle_path = media_data['subtitle_path'].replace('\\', '/')
-                    if sys.platform == "win32":
-                         subtitle_path = re.sub(r'([A-Za-z]):\\', r'/mnt/\1/', subtitle_path).replace('\\', '/')
-                    subtitle_path = subtitle_path.replace(':', '\\:')
-                    vf.append(f"subtitles='{subtitle_path}'")
-
-                eq_bands = [f"equalizer=f={f}:width_type=h:width={w}:g={main_window_ref.settings.get(f'eq_{b}', 0)}"
-                            for f, w, b in [(64, 50, 'bas'), (1000, 200, 'mellan'), (10000, 2000, 'diskant')]]
-                if any(v != 0 for v in [main_window_ref.settings.get(f'eq_{b}', 0) for b in ['bas', 'mellan', 'diskant']]):
-                    af.append(','.join(eq_bands))
-
-                if vf: args.extend(["-vf", ",".join(vf)])
-                if af: args.extend(["-af", ",".join(af)])
-
-                if media_data.get('media_type') == 'audio':
-                    if media_data.get('audio_codec') in ['aac', 'mp3'] and not af:
-                        args.extend(["-c:a", "copy"])
-                    else:
-                        args.extend(["-c:a", "aac", "-ac", "2"])
-                    args.extend(["-f", "adts"])
-                else: # video
-                    args.extend(["-c:v", "libx264", "-preset", "veryfast", "-tune", "zerolatency", 
-                                 "-c:a", "aac", "-ac", "2", "-f", "mp4", 
-                                 "-movflags", "frag_keyframe+empty_moov"])
-                args.append("pipe:1")
-                
-                proc = None
-                try:
-                    proc = subprocess.Popen(args, stdout=self.wfile, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-                    _, stderr_data = proc.communicate()
-                    
-                    if proc.returncode != 0:
-                        err_text = stderr_data.decode('utf-8', 'ignore')
-                        if 'Connection reset by peer' not in err_text and 'Broken pipe' not in err_text:
-                            print(f"FFmpeg-fel:\n{err_text}")
-
-                except BrokenPipeError:
-                    print("Anslutningen stängdes av klienten (förväntat beteende).")
-                except Exception as e:
-                    print(f"Oväntat fel i mediastream-hanteraren: {e}")
-                finally:
-                    if proc and proc.poll() is None:
-                        proc.kill()
-                        proc.wait()
-
-            def log_message(self, format, *args): return
-        
-        return MediaStreamHandler
-        
     def closeEvent(self, e):
-        self.save_json(SETTINGS_FILE, self.settings)
-        self.save_json(RESUME_FILE, self.resume_points)
+        if self.media_controller: self.update_resume_point(self.media_controller.status)
+        self.settings_state.save()
+        self.resume_state.save()
+        self.devices_state.save()
+        METADATA_CACHE.save()
+        URL_INFO_CACHE.save()
+        self.import_scheduler.cancel_all()
+        for watcher in self.folder_watchers.values(): watcher.stop()
+        LIBRARY.close()
+        shutdown_photo_pool()
         self.on_stop(clear_ui=False)
-        if self.browser:
-            try: stop_discovery(self.browser)
-            except Exception as ex: print(f"Fel vid stopp av discovery: {ex}")
+        self.media_server.stop()
+        self.discovery.stop()
         if self.cast_device: self.cast_device.disconnect()
+        for key in list(self.group_casts): self.remove_group_device(key)
         self.toggle_remote(force_off=True)
         e.accept()
 
     def on_remove_selected(self):
-        items_to_remove = self.playlist.selectedItems()
-        if not items_to_remove:
-            row = self.playlist.currentRow()
+        rows_to_remove = {self.playlist_model.video_index(mi.row()) for mi in self.playlist.selectionModel().selectedRows()}
+        rows_to_remove.discard(-1)
+        if not rows_to_remove:
+            row = self.selected_video_index()
             if row >= 0:
-                items_to_remove = [self.playlist.item(row)]
+                rows_to_remove = {row}
             else:
                 return
 
-        rows_to_remove = sorted([self.playlist.row(item) for item in items_to_remove], reverse=True)
+        self.remove_video_rows(rows_to_remove)
 
-        for row in rows_to_remove:
-            if row < 0: continue
-            if row == self.current_index: self.on_stop()
-            
-            self.playlist.takeItem(row) 
-            self.videos.pop(row)
+    def remove_video_rows(self, rows_to_remove):
+        if not rows_to_remove: return
+        rows_to_remove = sorted(rows_to_remove, reverse=True)
+        if self.current_index in rows_to_remove: self.on_stop()
 
-            if self.current_index > row: self.current_index -= 1
-            elif self.current_index == row: self.current_index = -1
+        removed_items = self.playlist_model.remove_videos(rows_to_remove)
+        self.search_index.remove(removed_items)
+        self.import_scheduler.cancel(removed_items)
+        for removed in removed_items:
+            if removed.get('type') == 'local': self.known_sources.discard(os.path.abspath(removed['src']))
+        if self.current_index >= 0:
+            self.current_index -= sum(1 for row in rows_to_remove if row < self.current_index)
         
         self.on_playlist_selection_changed()
         self.update_status_label() # ÄNDRING: Uppdatera räknaren
 
     def on_shuffle(self):
         if not self.videos: return
+        self.flush_pending_items()
         current_item = self.videos[self.current_index] if self.current_index >= 0 else None
         random.shuffle(self.videos)
         if current_item:
-            try: self.current_index = self.videos.index(current_item)
-            except ValueError: self.current_index = -1
-        self.repopulate_playlist()
+            self.current_index = next((i for i, v in enumerate(self.videos) if v is current_item), -1)
+        self.playlist_model.reset()
+        if self.current_index >= 0: self.select_video(self.current_index)
 
     def on_clear_list(self):
         self.on_stop()
-        self.videos.clear()
-        self.playlist.clear()
+        for scanner in self.active_scanners: scanner.cancelled = True
+        self.import_scheduler.cancel_all()
+        self.cast_when_ready = None
+        self.library_load = None
+        self.failed_items.clear()
+        self.pending_items.clear()
+        self.search_index.clear()
+        self.playlist_model.clear()
+        self.known_sources.clear()
         self.on_playlist_selection_changed()
         self.update_status_label() # ÄNDRING: Uppdatera räknaren
 
@@ -1122,31 +4003,119 @@ class MainWindow(QMainWindow):
 
     def on_add_dir(self):
         path = QFileDialog.getExistingDirectory(self, "Välj mapp")
-        if path:
-            all_files = [str(f) for ext in ALL_SUPPORTED_EXT for f in Path(path).rglob(f"*{ext}")]
-            self.add_files(all_files)
+        if path: self.scan_directory(path)
 
-    def on_save_list(self):
-        path, _ = QFileDialog.getSaveFileName(self, "Spara spellista", "", "JSON-filer (*.json)")
+    # --- Bevakade mappar ---
+    def on_watch_dir(self):
+        path = QFileDialog.getExistingDirectory(self, "Välj mapp att bevaka")
         if not path: return
-        
-        save_data = []
-        for v in self.videos:
-            item_data = {}
-            if v.get('type') == 'local':
-                item_data = {'type': 'local', 'src': v['src']}
-            elif v.get('type') == 'web':
-                item_data = {'type': 'web', 'src': v['original_url']}
-            
-            if 'rotation' in v:
-                item_data['rotation'] = v['rotation']
-            save_data.append(item_data)
-        
-        self.save_json(path, save_data)
+        path = os.path.abspath(path)
+        watched = self.settings.get('watched_folders', [])
+        if path in self.folder_watchers:
+            if QMessageBox.question(self, "Bevakad mapp", f"{path} bevakas redan. Sluta bevaka mappen?") == QMessageBox.Yes:
+                self.folder_watchers.pop(path).stop()
+                self.settings['watched_folders'] = [f for f in watched if f != path]
+            return
+        self.settings['watched_folders'] = watched + [path]
+        self.watch_folder(path)
+
+    def watch_folder(self, path):
+        # Mappen läses in en gång; därefter kommer bara ändringar från bevakaren.
+        if not os.path.isdir(path): return
+        watcher = FolderWatcher(path)
+        watcher.signals.changed.connect(self.apply_file_changes)
+        self.folder_watchers[os.path.abspath(path)] = watcher
+        watcher.start()
+        self.scan_directory(path)
+
+    def apply_file_changes(self, changed, removed):
+        local = {os.path.abspath(v['src']): v for v in self.videos + self.pending_items if v.get('type') == 'local'}
+        new_files = []
+        for path in changed:
+            v = local.get(os.path.abspath(path))
+            if v is None:
+                new_files.append(path)
+                continue
+            # Ändrad fil: posten analyseras om (metadatacachen känner igen den nya storleken/mtime).
+            self.import_scheduler.cancel([v])
+            v.update(dict(pending_local_info(v['src']), rotation=v.get('rotation', 0)))
+            self.import_scheduler.submit([v])
+            self.refreshed_items = True
+        if new_files: self.add_files(new_files)
+        if removed:
+            prefixes = tuple(os.path.join(os.path.abspath(p), '') for p in removed)
+            targets = {os.path.abspath(p) for p in removed}
+            for p in removed: METADATA_CACHE.discard(p)
+            def is_removed(v):
+                return v.get('type') == 'local' and (os.path.abspath(v['src']) in targets or os.path.abspath(v['src']).startswith(prefixes))
+            # Poster som ännu inte infogats (t.ex. under sidvis inläsning) tas bort ur kön direkt.
+            dropped = [v for v in self.pending_items if is_removed(v)]
+            if dropped:
+                self.pending_items = [v for v in self.pending_items if not is_removed(v)]
+                self.import_scheduler.cancel(dropped)
+                for v in dropped: self.known_sources.discard(os.path.abspath(v['src']))
+                if self.cast_when_ready and self.cast_when_ready[0] in dropped: self.cast_when_ready = None
+            self.remove_video_rows([i for i, v in enumerate(self.videos) if is_removed(v)])
+        if not self.pending_flush_timer.isActive(): self.pending_flush_timer.start(100)
+
+    def scan_directory(self, path):
+        scanner = DirectoryScanner(path)
+        scanner.signals.batch.connect(lambda batch: None if scanner.cancelled else self.add_files(batch))
+        scanner.signals.finished.connect(lambda: self.active_scanners.remove(scanner))
+        self.active_scanners.append(scanner)
+        self.threadpool.start(scanner)
+
+    def on_save_list(self):
+        name, ok = QInputDialog.getItem(self, "Spara spellista", "Namn:", LIBRARY.playlist_names(), 0, True)
+        if not (ok and name.strip()): return
+        try:
+            LIBRARY.save_playlist(name.strip(), self.videos)
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Fel", f"Kunde inte spara spellistan: {e}")
+            return
         QMessageBox.information(self, "Sparat", "Spellistan har sparats.")
 
     def on_load_list(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Ladda spellista", "", "JSON-filer (*.json)")
+        import_label = "Importera JSON-fil..."
+        try: names = LIBRARY.playlist_names()
+        except sqlite3.Error as e:
+            QMessageBox.critical(self, "Fel", f"Kunde inte läsa biblioteket: {e}")
+            return
+        name, ok = QInputDialog.getItem(self, "Ladda spellista", "Spellista:", names + [import_label], 0, False)
+        if not ok: return
+        if name == import_label:
+            self.import_json_list()
+            return
+        self.on_clear_list()
+        self.library_load = {'name': name, 'offset': 0}
+        self.load_playlist_page(self.library_load)
+
+    def load_playlist_page(self, load):
+        # Sparad metadata visas direkt; lokala filer kontrolleras i bakgrunden och webbadresser hämtas om vid behov.
+        if self.library_load is not load: return
+        rows = LIBRARY.playlist_page(load['name'], load['offset'], LIBRARY_PAGE_SIZE)
+        load['offset'] += len(rows)
+        checks = []
+        for info, size, mtime, rotation in rows:
+            v = dict(info, rotation=rotation, is_error=False)
+            if v.get('type') == 'local':
+                key = os.path.abspath(v['src'])
+                if key in self.known_sources: continue
+                self.known_sources.add(key)
+                checks.append((v['src'], size, mtime))
+            else:
+                # Förnyas först när posten ska spelas eller förberedas (revalidate_web_item).
+                v['stored'] = True
+            self.queue_playlist_item(v)
+        if checks:
+            self.execute_in_background(find_stale_files, checks, on_result=lambda result: self.apply_file_changes(*result))
+        if len(rows) == LIBRARY_PAGE_SIZE:
+            QTimer.singleShot(0, lambda: self.load_playlist_page(load))
+        else:
+            self.library_load = None
+
+    def import_json_list(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Importera spellista", "", "JSON-filer (*.json)")
         if not path: return
         
         self.on_clear_list()
@@ -1158,7 +4127,7 @@ class MainWindow(QMainWindow):
                 self.on_add_url(url=item['src'])
 
     def on_restart_cast(self):
-        if self.current_index >= 0: self.cast_video(self.current_index)
+        if self.current_index >= 0: self.cast_video(self.current_index, start_time=0)
 
     def handle_remote_command(self, command, value):
         if command == "play": self.on_play()